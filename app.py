@@ -1,10 +1,25 @@
 import json
+import math
+import os
+import time
 from typing import Dict, List
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import networkx as nx
-import requests
+
+from engine import perf
+from engine.aggregates import build_cube, slice_cube
+from engine.charts import PER_PAGE as TIMELINE_PER_PAGE, timeline_figures
+from engine.export import FORMATS as EXPORT_FORMATS, export_bytes
+from engine.datastore import DatasetRegistry, frame_digest, last_year_rows, view_mask
+from engine.ingest import compact_long, read_upload, upload_key
+from engine.network import compute_layout, impact_edges, network_figure, topology
+from engine.prefetch import Prefetcher, format_age, interval_from_env, targets_from_env
+from engine.pxcache import PxCache, cache_from_env, cache_key
+from engine.pxweb import fetch_chunked, fetch_incremental
+from engine.scenario import project
+from engine.sources import default_pxweb_example, load_fictive_data, pxweb_to_long
+from engine.trends import RANKINGS, rank_series, series_stats
+from engine.warehouse import Warehouse
 
 
 st.set_page_config(page_title="IA et Transition Écologique – Démo", layout="wide")#st.set_page_config(page_title="Climat & Politiques Publiques – Démo", layout="wide")
@@ -16,6 +31,10 @@ PRIMARY = "#0ea5e9"  # bleu doux
 ACCENT = "#22c55e"   # vert
 MUTED = "#94a3b8"    # gris
 
+# Entrepôt analytique local (DuckDB/SQLite) : activé si DATA_WAREHOUSE donne un chemin de fichier
+WAREHOUSE_PATH = os.environ.get("DATA_WAREHOUSE")
+WAREHOUSE_MODE = "Entrepôt local (toutes sources)"
+
 # ---------------------------
 # ------ SIDEBAR / HELP -----
 # ---------------------------
@@ -23,7 +42,7 @@ with st.sidebar:
     st.markdown("### Source de données")
     data_mode = st.radio(
         "Choisir la source",
-        ["Données fictives", "Données en ligne", "Fichier (CSV/XLSX)"],#["Fictives", "Helsinki – PxWeb", "Fichier (CSV/XLSX)"],
+        ["Données fictives", "Données en ligne", "Fichier (CSV/XLSX)"] + ([WAREHOUSE_MODE] if WAREHOUSE_PATH else []),#["Fictives", "Helsinki – PxWeb", "Fichier (CSV/XLSX)"],
         index=0
     )
     st.markdown("---")
@@ -44,154 +63,84 @@ with st.sidebar:
     #st.caption("Astuce : pour une démo, démarre en mode **Fictives**, puis montre "
      #          "comment passer à **Helsinki – PxWeb** ou **Fichier**.")
 
-# ---------------------------
-# --- FICTIVE DATA (DEFAULT)
-# ---------------------------
-def load_fictive_data():
-    # Série temporelle 2020–2025 pour 3 actions et leurs indicateurs.
-    years = list(range(2019, 2025))
-    actions_time = {
-        "Plantation d'arbres": {
-            "Émissions CO₂ (t/an)": [1000, 980, 960, 940, 920, 900],
-            "Surface verte (m²)": [5000, 5100, 5200, 5300, 5400, 5500],
-        },
-        "Lampadaires LED": {
-            "Consommation énergie (kWh/an)": [20000, 18000, 16000, 14000, 13000, 12000],
-            "Émissions CO₂ (t/an)": [800, 720, 640, 560, 520, 480],
-        },
-        "Compostage": {
-            "Déchets en décharge (t/an)": [500, 480, 460, 440, 420, 400],
-            "Économies (€/an)": [0, 1000, 2000, 3000, 4000, 5000],
-        }
-    }
-    rows = []
-    for action, inds in actions_time.items():
-        for ind, vals in inds.items():
-            for y, v in zip(years, vals):
-                rows.append({"source": "Fictif", "action": action, "indicateur": ind, "annee": y, "valeur": v})
-    return pd.DataFrame(rows), years, list(actions_time.keys())
+# Mesures du rerun (inertes si PERF_METRICS n'est pas défini, cf. engine/perf.py)
+perf_run = perf.begin_run(data_mode)
 
 # ---------------------------
 # ------ PXWEB (HELSINKI) ---
 # ---------------------------
-@st.cache_data(show_spinner=False)
+# Cache disque partagé entre processus / redémarrages (configurable par variables d'env.)
+@st.cache_resource
+def pxweb_cache() -> PxCache:
+    return cache_from_env()
+
+
+PX_CACHE_TTL = pxweb_cache().ttl
+
+
+@st.cache_data(show_spinner=False, ttl=min(PX_CACHE_TTL, 600))
 def pxweb_fetch(url: str, query: Dict) -> pd.DataFrame:
     """
     Interroge une table PxWeb en POST JSON et retourne un DataFrame aplati
-    avec colonnes des variables + 'value'.
+    avec colonnes des variables (catégorielles) + 'value' (+ 'status').
+    Passe par le cache disque (Parquet) avant d'appeler stat.hel.fi ; les
+    requêtes au-delà de la limite de cellules sont découpées et parallélisées.
 
     NOTE: suivez la doc PxWeb Helsinki (codes variables, filtres).
     """
-    r = requests.post(url, json=query, timeout=30)
-    r.raise_for_status()
-    j = r.json()
-
-    # PxWeb peut renvoyer "json-stat" (liste de values + dimension labels).
-    # On reconstruira un tableau long (tidy).
-    # Format minimal : j['value'] + j['dimension'] -> catégories.
-    values = j.get("value", [])
-    dims = j.get("dimension", {})
-    # Extraire les catégories (codes et labels) par dimension dans l'ordre
-    dim_order = j.get("id", [])
-    categories = []
-    for dim_id in dim_order:
-        dim = dims[dim_id]
-        cats = dim["category"]["index"]  # mapping code -> position
-        labels = dim["category"].get("label", {})
-        # On garde l’ordre d’index
-        sorted_codes = sorted(cats, key=lambda k: cats[k])
-        categories.append((dim_id, sorted_codes, labels))
-
-    # Produit cartésien des catégories -> chaque combinaison correspond à une valeur
-    from itertools import product
-    combos = list(product(*[codes for (_, codes, _) in categories]))
-
-    rows = []
-    for i, combo in enumerate(combos):
-        row = {}
-        for (dim_id, codes, labels), code_val in zip(categories, combo):
-            row[dim_id] = labels.get(code_val, code_val)
-        if i < len(values):
-            row["value"] = values[i]
-        else:
-            row["value"] = None
-        rows.append(row)
-
-    return pd.DataFrame(rows)
-
-def default_pxweb_example():
-    """
-    Exemple prêt-à-copier depuis la doc PxWeb Helsinki.
-    ⚠️ A ADAPTER à ta table environnementale (voir API helper sur stat.hel.fi).
+    perf.miss()
+    return pxweb_cache().fetch(url, query, fetch_chunked)
 
-    Ici on montre la structure (Alue/Vuosi). Remplace l'URL et les codes variables
-    par ceux de ta table (ex. indicateurs de durabilité / climat).
+@st.cache_resource
+def pxweb_prefetcher() -> Prefetcher:
     """
-    url = "https://stat.hel.fi:443/api/v1/fi/Ymparistotilasto/ene/kauen/ymp_kauen_002f.px"
-    example_query = {
-  "query": [
-    {
-      "code": "Tiedot",
-      "selection": {
-        "filter": "item",
-        "values": [
-          "määkpl"
-        ]
-      }
-    }
-  ],
-  "response": {
-    "format": "json-stat"
-  }
-}
-    return url, example_query
-
-# ---------------------------
-# ------ FILE UPLOADER ------
-# ---------------------------
-def normalize_file(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Essaie de normaliser un fichier 'réel' en colonnes
-    ['source','action','indicateur','annee','valeur'].
-    Si colonnes inconnues, laisse l’utilisateur mapper via l’UI.
+    Préchargement des tables PxWeb en arrière-plan (cf. engine/prefetch.py), démarré
+    une fois par processus. PXWEB_PREFETCH : chemin d'un fichier JSON de
+    tables, "off" pour désactiver ; par défaut la table d'exemple.
     """
-    cols = [c.lower() for c in df.columns]
-    df.columns = cols
-    # Heuristiques fréquentes
-    mapping = {}
-    for c in df.columns:
-        if c.startswith("annee") or c in ("year","annee","vuosi","vuodet"):
-            mapping[c] = "annee"
-        if c in ("valeur","value","arvo"):
-            mapping[c] = "valeur"
-        if "action" in c:
-            mapping[c] = "action"
-        if "indicateur" in c or "indicator" in c or "indik" in c:
-            mapping[c] = "indicateur"
-
-    df = df.rename(columns=mapping)
-    if "annee" in df.columns and "valeur" in df.columns:
-        if "action" not in df.columns:
-            df["action"] = "Mesure réelle"
-        if "indicateur" not in df.columns:
-            # Essaie de trouver une colonne catégorielle pour l’indicateur
-            cat_cols = [c for c in df.columns if c not in ("annee","valeur","action")]
-            if cat_cols:
-                df["indicateur"] = df[cat_cols[0]].astype(str)
-            else:
-                df["indicateur"] = "Indicateur"
-        out = df[["action","indicateur","annee","valeur"]].copy()
-        out["source"] = "Réel (fichier)"
-        return out
-    # sinon, on renverra brut et l’utilisateur mappera via l’UI (non implémenté ici pour aller vite)
-    df["source"] = "Réel (fichier – brut)"
+    return Prefetcher(pxweb_cache(), fetch_chunked, targets_from_env(), interval=interval_from_env()).start()
+
+
+pxweb_prefetcher()
+
+@st.cache_resource
+def datasets() -> DatasetRegistry:
+    """Registre partagé par toutes les sessions du processus (cf. engine/datastore.py)."""
+    return DatasetRegistry(int(float(os.environ.get("DATASET_STORE_MAX_MB", 1024)) * 2**20))
+
+
+@st.cache_resource
+def warehouse():
+    """Entrepôt local partagé par le processus, ou None s'il n'est pas configuré (cf. engine/warehouse.py)."""
+    if not WAREHOUSE_PATH:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(WAREHOUSE_PATH)), exist_ok=True)
+    return Warehouse(WAREHOUSE_PATH)
+
+
+def publish(dataset_key: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Verse un jeu fraîchement chargé dans l'entrepôt local (s'il est activé) et le retourne."""
+    perf.miss()
+    wh = warehouse()
+    if wh is not None:
+        wh.ingest(dataset_key, df)
     return df
 
+
+def load_dataset(dataset_key: str, loader) -> pd.DataFrame:
+    """Jeu partagé `dataset_key`, chargé par `loader` (qui passe par publish) au premier appel."""
+    with perf.span("load", cache="hit", source=dataset_key.split(":")[0]) as s:
+        df = datasets().get_or_load(dataset_key, loader)
+        s["rows"] = len(df)
+    return df
+
+
 # ---------------------------
 # ---- LOAD CHOSEN DATA -----
 # ---------------------------
 if data_mode == "Données fictives":
-    df_long, YEARS, ACTIONS = load_fictive_data()
+    dataset_key = "fictif"
+    df_long = load_dataset(dataset_key, lambda: publish(dataset_key, compact_long(load_fictive_data()[0])))
 
 elif data_mode == "Données en ligne":
     st.info("⚙️ Mode **Helsinki – PxWeb** : adapte l’URL de table et la requête JSON. Tu peux obtenir les deux via le bouton “Ajouter le tableau à votre application / API helper” dans l’interface PxWeb d’Helsinki.", icon="ℹ️")
@@ -200,225 +149,377 @@ elif data_mode == "Données en ligne":
         url_px = st.text_input("URL de la table PxWeb", value=url_default, help="Remplace par une table environnementale/indicateurs durables.")
         q_str = st.text_area("JSON de requête", value=json.dumps(q_default, indent=2))
         fmt = st.selectbox("Format de réponse", ["json-stat"], index=0)
+        incremental = st.checkbox(
+            "Rafraîchissement incrémental par année", value=True,
+            help="Réutilise les années déjà téléchargées et ne redemande que les années manquantes + la plus récente (révisions)."
+        )
     run = st.button("📡 Interroger PxWeb")
+    fetched_at = None
     if run:
         try:
             q = json.loads(q_str)
             q["response"] = {"format": fmt}
-            df_px = pxweb_fetch(url_px, q)
-            # Heuristique de normalisation : cherche colonnes temps/aire/indicateur
-            # On renomme les colonnes les plus probables (Vuosi=année)
-            rename_map = {}
-            for c in df_px.columns:
-                lc = c.lower()
-                if "vuosi" in lc or "vuodet" in lc or "vuosi (year)" in lc:
-                    rename_map[c] = "annee"
-                if "alue" in lc:  # zone
-                    rename_map[c] = "action"  # on le pose comme 'action' par défaut
-                if "value" == lc:
-                    rename_map[c] = "valeur"
-            df_px = df_px.rename(columns=rename_map)
-            # Ajoute indicateur si manquant
-            if "indicateur" not in df_px.columns:
-                df_px["indicateur"] = "Indicateur PxWeb"
-            # Ajoute année si manquante
-            if "annee" not in df_px.columns and "Vuosi" in df_px.columns:
-                df_px = df_px.rename(columns={"Vuosi": "annee"})
-            # Par sécurité, essaie de caster année
-            if "annee" in df_px.columns:
-                df_px["annee"] = pd.to_numeric(df_px["annee"], errors="coerce")
-            df_px["source"] = "Réel (PxWeb)"
-            # Construit df_long
-            if not {"action","indicateur","annee","valeur"}.issubset(df_px.columns):
-                # On tente une version minimale
-                candidate_cols = [c for c in df_px.columns if c not in ("valeur","value")]
-                if candidate_cols:
-                    df_px["action"] = df_px[candidate_cols[0]].astype(str)
-                if "valeur" not in df_px.columns and "value" in df_px.columns:
-                    df_px["valeur"] = df_px["value"]
-                if "annee" not in df_px.columns:
-                    df_px["annee"] = pd.NA
-                if "indicateur" not in df_px.columns:
-                    df_px["indicateur"] = "Indicateur PxWeb"
-            df_long = df_px[["source","action","indicateur","annee","valeur"]].dropna(subset=["valeur"]).copy()
+            with perf.span("load", cache="hit", source="pxweb") as s:
+                px_key = cache_key(url_px, q)
+                if incremental:
+                    df_px, delta_stats = fetch_incremental(url_px, q, pxweb_cache())
+                    # Aussi sous la clé de la requête : sans clic, les reruns et les autres sessions
+                    # relisent cette entrée (comme celles du préchargeur) au lieu de tout retélécharger
+                    pxweb_cache().put(px_key, df_px, url_px, q)
+                    st.caption("Delta PxWeb : {fetched:,} cellules téléchargées, {reused:,} réutilisées.".format(**delta_stats))
+                else:
+                    df_px = pxweb_fetch(url_px, q)
+                fetched_at = pxweb_cache().fetched_at(px_key)
+                df_long = publish("pxweb:" + px_key, pxweb_to_long(df_px))
+                # Clé versionnée par le contenu : un rafraîchissement qui apporte des révisions
+                # invalide cube, tendances, projections et exports mis en cache pour l'ancienne version
+                dataset_key = f"pxweb:{px_key}@{frame_digest(df_long)}"
+                df_long = datasets().put(dataset_key, df_long)
+                s["rows"] = len(df_long)
+            # Seule la clé reste en session (le frame est partagé) : reruns sans nouveau clic
+            st.session_state["pxweb_data"] = (dataset_key, url_px, q)
         except Exception as e:
             st.error(f"Erreur PxWeb: {e}")
             st.stop()
+    elif "pxweb_data" in st.session_state:
+        dataset_key, url_px, q = st.session_state["pxweb_data"]
+        px_key = cache_key(url_px, q)
+
+        def reload() -> pd.DataFrame:
+            # Jeu évincé du registre : entrée disque écrite au clic (complet ou incrémental),
+            # sinon rafraîchissement incrémental (seules les années manquantes + la plus récente)
+            hit = pxweb_cache().get(px_key)
+            if hit is not None:
+                df_px = hit[0]
+            else:
+                df_px = fetch_incremental(url_px, q, pxweb_cache())[0]
+                pxweb_cache().put(px_key, df_px, url_px, q)
+            return publish("pxweb:" + px_key, pxweb_to_long(df_px))
+
+        df_long = load_dataset(dataset_key, reload)
+        fetched_at = pxweb_cache().fetched_at(px_key)
     else:
+        # Sans clic : lecture des données préchargées par le thread de fond (aucun appel réseau)
+        try:
+            q = json.loads(q_str)
+        except ValueError as e:
+            st.error(f"JSON de requête invalide : {e}")
+            st.stop()
+        q["response"] = {"format": fmt}
+        px_key = cache_key(url_px, q)
+        fetched_at = pxweb_cache().fetched_at(px_key)
+        df_long = None
+        if fetched_at is not None:
+            def from_cache() -> pd.DataFrame:
+                hit = pxweb_cache().get(px_key)
+                if hit is None:  # entrée évincée ou illisible depuis fetched_at()
+                    raise LookupError(px_key)
+                return publish("pxweb:" + px_key, pxweb_to_long(hit[0]))
+
+            # Clé versionnée : un rafraîchissement du préchargeur remplace le jeu partagé
+            dataset_key = f"pxweb:{px_key}@{fetched_at:.0f}"
+            try:
+                df_long = load_dataset(dataset_key, from_cache)
+            except LookupError:
+                fetched_at = None
+        if df_long is None:
+            prefetched = {cache_key(u, t) for u, t in pxweb_prefetcher().targets}
+            if px_key in prefetched:
+                st.info("Préchargement de la table en cours : réessaie dans un instant ou clique sur « Interroger PxWeb ».", icon="⏳")
+            else:
+                st.info("Cette requête n'est pas préchargée : clique sur « Interroger PxWeb » pour la télécharger.", icon="📡")
+            st.stop()
+    if fetched_at is not None:
+        st.caption(f"Données PxWeb téléchargées il y a {format_age(time.time() - fetched_at)}.")
+
+elif data_mode == WAREHOUSE_MODE:
+    # Rien n'est chargé en mémoire : filtres et agrégats sont exécutés dans l'entrepôt
+    df_long = None
+    if warehouse().year_range() is None:
+        st.info("L'entrepôt local est vide : charge d'abord des données fictives, PxWeb ou un fichier.", icon="🗄️")
         st.stop()
 
 else:  # Fichier
-    up = st.file_uploader("Dépose un CSV/XLSX (HSY ou autre)", type=["csv","xlsx"])
+    up = st.file_uploader("Dépose un CSV/XLSX/Parquet (HSY ou autre)", type=["csv","xlsx","parquet","feather"])
     if up is None:
-        st.info("Télécharge un fichier HSY (émissions/énergie) ou tout autre open data en CSV/XLSX, puis re-lance.", icon="📄")
+        st.info("Télécharge un fichier HSY (émissions/énergie) ou tout autre open data en CSV/XLSX/Parquet, puis re-lance.", icon="📄")
         st.stop()
     try:
-        if up.name.lower().endswith(".csv"):
-            raw = pd.read_csv(up)
-        else:
-            raw = pd.read_excel(up)
-        df_long = normalize_file(raw)
+        # Clé par contenu, calculée une fois par dépôt : un même fichier n'est chargé (et versé) qu'une fois
+        upload_keys = st.session_state.setdefault("upload_keys", {})
+        if up.file_id not in upload_keys:
+            upload_keys[up.file_id] = upload_key(up)
+        dataset_key = upload_keys[up.file_id]
+        # Lecture colonnaire des seules colonnes utiles + types compacts (cf. engine/ingest.py), une fois par fichier
+        df_long = load_dataset(dataset_key, lambda: publish(dataset_key, read_upload(up)))
     except Exception as e:
         st.error(f"Impossible de lire le fichier: {e}")
         st.stop()
 
+@st.cache_resource(show_spinner=False, max_entries=8)
+def aggregate_cube(dataset_key: str, _df: pd.DataFrame) -> pd.Series:
+    """Cube (indicateur, action, annee) -> valeur, calculé une fois par jeu de données."""
+    perf.miss()
+    return build_cube(_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def warehouse_cube(dataset_key: str, actions: tuple, years: tuple, _wh, _filters: dict) -> pd.Series:
+    """Cube filtré agrégé dans l'entrepôt (requête SQL), mis en cache par version et filtre."""
+    perf.miss()
+    return _wh.cube(actions, years, **_filters)
+
+
 # ---------------------------
 # ----------- UI ------------
 # ---------------------------
 st.title("🌱 Démo IA et Transition Écologique")#st.title("🌱 Démo Climat & Politiques Publiques – Version Finale")
 st.caption("Mode données : **{}**".format(data_mode))
 
-# Choix actions (multi-sélection -> scénarios combinés)
-actions = sorted(df_long["action"].dropna().unique())
-default_actions = actions[:2] if len(actions) >= 2 else actions
-selected_actions = st.multiselect("Sélectionne une ou plusieurs actions", actions, default=default_actions)
-
-# Filtre années
-years_all = sorted(df_long["annee"].dropna().unique())
-if len(years_all) == 0:
-    years_all = list(range(2019, 2025))
-sel_years = st.slider("Plage d'années", int(min(years_all)), int(max(years_all)), (int(min(years_all)), int(max(years_all))))
-
-df_view = df_long[
-    df_long["action"].isin(selected_actions) &
-    df_long["annee"].between(sel_years[0], sel_years[1], inclusive="both")
-].copy()
+if df_long is None:
+    wh = warehouse()
+    sources = st.multiselect("Sources", wh.distinct("source"), default=[], placeholder="Toutes les sources")
+    actions = wh.distinct("action", sources)
+    default_actions = actions[:2] if len(actions) >= 2 else actions
+    selected_actions = st.multiselect("Sélectionne une ou plusieurs actions", actions, default=default_actions)
+    selected_inds = st.multiselect("Indicateurs", wh.distinct("indicateur", sources), default=[], placeholder="Tous les indicateurs")
+    y0, y1 = wh.year_range()
+    sel_years = st.slider("Plage d'années", y0, max(y1, y0 + 1), (y0, y1))
+
+    # Clé de la vue : version de l'entrepôt (change à chaque ingestion) + filtres hors actions/années
+    dataset_key = "warehouse:{}:{}:{}".format(wh.version(), "|".join(sources), "|".join(selected_inds))
+    filters = dict(indicators=selected_inds, sources=sources)
+    with perf.span("view", cache="hit", source="warehouse") as s:
+        cube_view = warehouse_cube(dataset_key, tuple(selected_actions), tuple(sel_years), wh, filters)
+        df_last = wh.rows(selected_actions, sel_years, last_year_only=True, **filters)
+        s["rows"] = len(cube_view)
+    view_frame = lambda: wh.rows(selected_actions, sel_years, **filters)
+else:
+    # Choix actions (multi-sélection -> scénarios combinés)
+    actions = sorted(df_long["action"].dropna().unique())
+    default_actions = actions[:2] if len(actions) >= 2 else actions
+    selected_actions = st.multiselect("Sélectionne une ou plusieurs actions", actions, default=default_actions)
+
+    # Filtre années
+    years_all = sorted(df_long["annee"].dropna().unique())
+    if len(years_all) == 0:
+        years_all = list(range(2019, 2025))
+    sel_years = st.slider("Plage d'années", int(min(years_all)), int(max(years_all)), (int(min(years_all)), int(max(years_all))))
+
+    with perf.span("view", cache="hit") as s:
+        # Vue = masque de lignes sur le jeu partagé (aucune copie de df_long par session)
+        view_rows = view_mask(df_long, selected_actions, sel_years)
+
+        # Vue filtrée du cube : sert les KPI et la timeline sans rebalayer df_long
+        cube_view = slice_cube(aggregate_cube(dataset_key, df_long), selected_actions, sel_years)
+        df_last = last_year_rows(df_long, view_rows)
+        s["rows"] = int(view_rows.sum())
+    view_frame = lambda: df_long[view_rows]
 
 # ---------------------------
 # ---------- KPI ------------
 # ---------------------------
-def kpi_block(df: pd.DataFrame):
-    kpis = []
-    for ind in df["indicateur"].unique():
-        dfi = df[df["indicateur"] == ind].groupby("annee", as_index=False)["valeur"].sum().sort_values("annee")
-        if len(dfi) >= 2:
-            v0 = dfi["valeur"].iloc[0]
-            v1 = dfi["valeur"].iloc[-1]
-            delta = v1 - v0
-            pct = (delta / v0 * 100) if (v0 != 0 and pd.notna(v0)) else None
-            kpis.append((ind, v0, v1, delta, pct))
-    kpis = sorted(kpis, key=lambda t: abs(t[3]), reverse=True)[:3]
-    cols = st.columns(max(1, len(kpis)))
-    for c, (ind, v0, v1, d, p) in zip(cols, kpis):
+@st.cache_data(show_spinner=False, max_entries=16)
+def trend_stats(dataset_key: str, actions: tuple, years: tuple, _view: pd.Series) -> pd.DataFrame:
+    """Tendances de toutes les séries (action, indicateur) filtrées, en une passe (cf. engine/trends.py)."""
+    perf.miss()
+    return series_stats(_view)
+
+
+def kpi_block(ranked: pd.DataFrame):
+    """Cartes des 3 premières séries du classement."""
+    top = ranked.head(3)
+    cols = st.columns(max(1, len(top)))
+    for c, ((ind, act), r) in zip(cols, top.iterrows()):
         with c:
+            d = r.delta
             trend = "↘︎" if d < 0 else "↗︎"
             color = ACCENT if d < 0 and ("CO₂" in ind or "Déchets" in ind or "Consommation" in ind) else PRIMARY
             # Gérer p None
-            if p is None:
+            if pd.isna(r.pct):
                 pct_str = "N/A"
                 sign = ""
             else:
-                pct_str = f"{p:.1f}%"
-                sign = "+" if p >= 0 else ""
+                pct_str = f"{r.pct:.1f}%"
+                sign = "+" if r.pct >= 0 else ""
+            tcac = "" if pd.isna(r.tcac) else f" · TCAC {r.tcac:+.1f}%/an"
+            alert = f" · ⚠️ anomalie {r.annee_anomalie}" if r.anomalie else ""
             st.markdown(f"""
                 <div style='padding:12px;border-radius:16px;border:1px solid {MUTED};'>
-                    <div style='color:{MUTED};font-size:13px'>{ind}</div>
-                    <div style='font-size:26px;font-weight:700'>{trend} {v1:,.0f}</div>
-                    <div style='color:{color};font-size:13px'>vs {v0:,.0f} ({sign}{pct_str})</div>
+                    <div style='color:{MUTED};font-size:13px'>{ind} — {act}</div>
+                    <div style='font-size:26px;font-weight:700'>{trend} {r.v1:,.0f}</div>
+                    <div style='color:{color};font-size:13px'>vs {r.v0:,.0f} ({sign}{pct_str})</div>
+                    <div style='color:{MUTED};font-size:12px'>Pente {r.pente:+,.1f}/an{tcac}{alert}</div>
                 </div>
             """, unsafe_allow_html=True)
 
 
-kpi_block(df_view)
+@st.fragment
+def leaderboard_section(ranked: pd.DataFrame):
+    """Classement complet des séries ; le filtre d'anomalies ne relance que ce fragment."""
+    with st.expander(f"🏁 Classement des séries ({len(ranked):,})"):
+        only = st.toggle("Anomalies seulement", value=False, key="lb_anomalies")
+        table = ranked[ranked["anomalie"]] if only else ranked
+        st.dataframe(
+            table.reset_index(),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "pct": st.column_config.NumberColumn("Variation (%)", format="%.1f"),
+                "pente": st.column_config.NumberColumn("Pente (/an)", format="%.2f"),
+                "tcac": st.column_config.NumberColumn("TCAC (%/an)", format="%.1f"),
+                "volatilite": st.column_config.NumberColumn("Volatilité", format="%.3f"),
+            },
+        )
+
+
+kpi_rank = st.selectbox("Classer les séries par", list(RANKINGS), key="kpi_rank")
+with perf.span("kpi", cache="hit") as s:
+    ranked = rank_series(trend_stats(dataset_key, tuple(selected_actions), tuple(sel_years), cube_view), kpi_rank)
+    kpi_block(ranked)
+    s["rows"] = len(ranked)
+leaderboard_section(ranked)
 
 # ---------------------------
-# ----- TIMELINE CHART ------
+# ----- CACHES DES SECTIONS -
 # ---------------------------
-st.subheader("📈 Évolution temporelle")
-for ind in df_view["indicateur"].unique():
-    dfi = df_view[df_view["indicateur"] == ind].groupby(["annee","action"], as_index=False)["valeur"].sum()
-    fig = go.Figure()
-    for act in dfi["action"].unique():
-        dfa = dfi[dfi["action"] == act].sort_values("annee")
-        fig.add_trace(go.Scatter(x=dfa["annee"], y=dfa["valeur"], mode="lines+markers", name=act))
-    fig.update_layout(height=320, margin=dict(l=20,r=20,t=40,b=20), title=ind)
-    st.plotly_chart(fig, use_container_width=True)
+@st.cache_data(show_spinner=False, max_entries=16)
+def projection_bands(dataset_key: str, actions: tuple, years: tuple, intensities: tuple,
+                     default_pct: int, horizon: int, n_sims: int, _view: pd.Series) -> pd.DataFrame:
+    """Percentiles Monte Carlo de toutes les séries filtrées (cf. scenario.project)."""
+    perf.miss()
+    return project(_view, dict(intensities), default_pct, horizon=horizon, n_sims=n_sims)
 
-# ---------------------------
-# ---- SCÉNARIO PROJECTION --
-# ---------------------------
-st.subheader("🧭 Scénario (projection simple)")
-colA, colB = st.columns(2)
-with colA:
-    intensite = st.slider("Intensité (%) appliquée sur la dernière année", 50, 200, 100)
-with colB:
-    st.caption("👉 Interprétation rapide : <100% = effort réduit, >100% = effort renforcé.")
-df_last = df_view[df_view["annee"] == df_view["annee"].max()].copy()
-df_last["proj"] = df_last["valeur"] * (intensite / 100.0)
-
-st.dataframe(
-    df_last[["action","indicateur","valeur","proj"]]
-    .rename(columns={"valeur":"Récent (observé)","proj":"Projeté (scénario)"}),
-    use_container_width=True
-)
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def timeline_page(dataset_key: str, actions: tuple, years: tuple, indicators: tuple, packed: bool,
+                  scenario: tuple, _view: pd.Series, _bands):
+    """Figures (WebGL, sous-échantillonnées) mises en cache par (jeu de données, filtre, page, scénario)."""
+    perf.miss()
+    return timeline_figures(_view, indicators, packed=packed, bands=_bands)
 
-# ---------------------------
-# ------ IMPACT NETWORK -----
-st.subheader("🕸️ Réseau d’impacts (action → indicateur)")
-
-# 1. Creer le graphe pondéré
-G = nx.DiGraph()
-for _, r in df_last.iterrows():
-    weight = abs((r["proj"] or 0) - (r["valeur"] or 0))
-    G.add_edge(r["action"], r["indicateur"], weight=weight)
-
-# 2. Générer la mise en page
-pos = nx.spring_layout(G, seed=42)
-
-# 3. Créer une trace pour chaque lien pour permettre une épaisseur variable
-edge_traces = []
-for u, v, d in G.edges(data=True):
-    x0, y0 = pos[u]
-    x1, y1 = pos[v]
-    thickness = d["weight"] * 5 + 1  # Facteur 5 pour visibilité, minimum 1
-    trace = go.Scatter(
-        x=[x0, x1], y=[y0, y1],
-        mode="lines",
-        line=dict(width=thickness, color="#888"),
-        hoverinfo="none"
-    )
-    edge_traces.append(trace)
-
-# 4. Préparer les nœuds avec deux couleurs distinctes
-node_x, node_y, labels, node_colors = [], [], [], []
-for node, (x, y) in pos.items():
-    node_x.append(x)
-    node_y.append(y)
-    labels.append(node)
-    if node in df_last["action"].values:
-        node_colors.append('lightgreen')  # actions en vert
-    else:
-        node_colors.append('skyblue')     # indicateurs en bleu
 
-node_trace = go.Scatter(
-    x=node_x, y=node_y,
-    mode="markers+text",
-    text=labels,
-    textposition="bottom center",
-    marker=dict(size=28, color=node_colors, line=dict(width=2, color='#555'))
-)
+@st.cache_data(show_spinner=False, max_entries=32)
+def network_layout(topo, method: str):
+    """Mise en page mise en cache par topologie : le curseur d'intensité ne la recalcule pas."""
+    perf.miss()
+    return compute_layout(topo, method)
 
-# 5. Construire et afficher la figure
-fig_net = go.Figure(data=edge_traces + [node_trace])
-fig_net.update_layout(
-    height=360,
-    showlegend=False,
-    margin=dict(l=10, r=10, t=10, b=10)
-)
-st.plotly_chart(fig_net, use_container_width=True)
 
+@st.cache_data(show_spinner=False, max_entries=8)
+def export_view(dataset_key: str, actions: tuple, years: tuple, fmt: str, _frame) -> bytes:
+    """Fichier d'export de la vue filtrée, généré au clic et mis en cache par filtre.
+    `_frame` matérialise la vue (masque du jeu en mémoire ou requête sur l'entrepôt)."""
+    perf.miss()
+    return export_bytes(_frame(), fmt)
+
+
+# ---------------------------
+# -- TIMELINE / SCÉNARIO / RÉSEAU
+# ---------------------------
+@st.fragment
+def analysis_section(dataset_key: str, df_last: pd.DataFrame, cube_view: pd.Series,
+                     selected_actions: list, sel_years: tuple):
+    """
+    Timeline, scénario et réseau d'impacts. Fragment : les widgets de cette
+    section (intensités, horizon, page, mise en page) ne relancent qu'elle,
+    sans recharger ni refiltrer le jeu de données.
+    """
+    filt = (dataset_key, tuple(selected_actions), tuple(sel_years))
+
+    # ----- TIMELINE CHART ------
+    st.subheader("📈 Évolution temporelle")
+    # Rempli après la section scénario, pour y tracer les bandes de projection
+    timeline_slot = st.container()
+
+    # ---- SCÉNARIO PROJECTION --
+    st.subheader("🧭 Scénario (projection)")
+    colA, colB = st.columns(2)
+    with colA:
+        intensite = st.slider("Intensité (%) appliquée sur la dernière année", 50, 200, 100)
+        horizon = st.slider("Horizon (années)", 1, 15, 5, key="horizon")
+    with colB:
+        st.caption("👉 Interprétation rapide : <100% = effort réduit, >100% = effort renforcé.")
+        mc_on = st.toggle("Bandes Monte Carlo (P5–P95) sur la timeline", value=True, key="mc_on")
+        n_sims = st.select_slider("Trajectoires simulées", [200, 500, 1000, 2000, 5000], value=1000, key="mc_sims")
+    with st.expander("Intensité par action"):
+        # Sans clé : déplacer l'intensité globale réinitialise les réglages par action
+        intens_by_action = {a: st.slider(str(a), 50, 200, intensite) for a in selected_actions}
+
+    act_pct = df_last["action"].astype(str).map(intens_by_action).fillna(intensite).astype(float)
+    df_last = df_last.assign(proj=df_last["valeur"] * (act_pct / 100.0))
+
+    scenario_key = (tuple(sorted(intens_by_action.items())), intensite, horizon, n_sims)
+    with perf.span("scenario.projection", cache="hit", sims=n_sims if mc_on else 0):
+        bands = projection_bands(*filt, *scenario_key, cube_view) if mc_on else None
+
+    st.dataframe(
+        df_last[["action","indicateur","valeur","proj"]]
+        .rename(columns={"valeur":"Récent (observé)","proj":"Projeté (scénario)"}),
+        use_container_width=True
+    )
+
+    # ----- TIMELINE (suite) ----
+    with timeline_slot:
+        indicators = list(cube_view.index.get_level_values("indicateur").unique())
+        n_pages = max(1, math.ceil(len(indicators) / TIMELINE_PER_PAGE))
+        colT1, colT2 = st.columns(2)
+        with colT1:
+            packed = st.toggle("Figure unique (sous-graphiques)", value=len(indicators) > TIMELINE_PER_PAGE, key="tl_packed")
+        with colT2:
+            page = st.number_input("Page", 1, n_pages, 1, key="tl_page") if n_pages > 1 else 1
+        page_inds = tuple(indicators[(page - 1) * TIMELINE_PER_PAGE: page * TIMELINE_PER_PAGE])
+        with perf.span("timeline", cache="hit", rows=len(cube_view)):
+            figs = timeline_page(*filt, page_inds, packed, scenario_key if mc_on else None, cube_view, bands)
+            for fig in figs:
+                st.plotly_chart(fig, use_container_width=True)
+
+    # ------ IMPACT NETWORK -----
+    st.subheader("🕸️ Réseau d’impacts (action → indicateur)")
+    layout_choice = st.radio(
+        "Mise en page", ["Automatique", "Ressort", "Bipartite (action → indicateur)"],
+        horizontal=True, key="net_layout"
+    )
+    edges = impact_edges(df_last)
+    with perf.span("network.layout", cache="hit", rows=len(edges)):
+        pos = network_layout(
+            topology(edges),
+            {"Automatique": "auto", "Ressort": "spring"}.get(layout_choice, "bipartite"),
+        )
+    with perf.span("network.figure", rows=len(edges)):
+        st.plotly_chart(network_figure(edges, pos), use_container_width=True)
 
 
 # ---------------------------
 # --------- EXPORT ----------
 # ---------------------------
-st.download_button(
-    "💾 Export CSV (vue filtrée)",
-    data=df_view.to_csv(index=False).encode("utf-8"),
-    file_name="vue_filtrée_demo_climat.csv",
-    mime="text/csv"
-)
+@st.fragment
+def export_section(dataset_key: str, view_frame, selected_actions: list, sel_years: tuple):
+    """Choix du format et bouton d'export ; fragment pour ne pas relancer la page."""
+    colE1, colE2 = st.columns([1, 3])
+    with colE1:
+        export_fmt = st.selectbox("Format d'export", list(EXPORT_FORMATS), key="export_fmt")
+    export_ext, export_mime = EXPORT_FORMATS[export_fmt]
+
+    def export_data() -> bytes:
+        with perf.span("export", cache="hit", format=export_ext) as s:
+            data = export_view(dataset_key, tuple(selected_actions), tuple(sel_years), export_fmt, view_frame)
+            s["bytes"] = len(data)
+        return data
+
+    with colE2:
+        # data=callable : sérialisation différée jusqu'au clic (aucun coût aux autres reruns)
+        st.download_button(
+            "💾 Export (vue filtrée)",
+            data=export_data,
+            file_name=f"vue_filtrée_demo_climat.{export_ext}",
+            mime=export_mime,
+            on_click="ignore",
+        )
+
+
+analysis_section(dataset_key, df_last, cube_view, selected_actions, sel_years)
+export_section(dataset_key, view_frame, selected_actions, sel_years)
 
 # ---------------------------
 # --------- FOOTER ----------
@@ -430,3 +531,23 @@ with st.expander("Notes"):#with st.expander("Notes pour la démo (à dire à l
 - L’outil se décline pour le **pilotage des politiques publiques**, l’**aménagement** (logement, mobilité) etc.
     """)
 
+# ---------------------------
+# ------ PERFORMANCE --------
+# ---------------------------
+def perf_panel(spans: list):
+    """Mesures du dernier rerun complet et totaux du processus."""
+    if spans:
+        table = pd.DataFrame(spans)
+        st.caption(f"Dernier rerun : {len(table)} sections (une section imbriquée est aussi comptée dans son parent).")
+        st.dataframe(table, use_container_width=True, hide_index=True)
+    totals = pd.DataFrame.from_dict(perf.totals(), orient="index")
+    if len(totals):
+        totals["ms_moyen"] = totals["seconds"] / totals["count"] * 1000
+        st.caption("Depuis le démarrage du processus (fragments et exports inclus) :")
+        st.dataframe(totals[["count", "ms_moyen", "hit", "miss", "rows", "bytes"]], use_container_width=True)
+
+
+perf_spans = perf.end_run(perf_run)
+if perf.ENABLED:
+    with st.sidebar.expander("⏱️ Performance"):
+        perf_panel(perf_spans)
@@ -0,0 +1,80 @@
+"""
+Benchmark du décodeur json-stat : boucle historique (itertools.product +
+un dict par cellule) vs pxweb.decode_jsonstat (vectorisé) sur des cubes
+synthétiques.
+
+Usage : python benchmarks/bench_jsonstat.py [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from engine.pxweb import decode_jsonstat  # noqa: E402
+from stub_pxweb import synthetic_cube  # noqa: E402
+
+# (Alue, Vuosi, Tiedot) : du petit tableau au cube "multi-millions de cellules"
+SHAPES = [(10, 10, 5), (100, 30, 20), (500, 40, 50), (1000, 50, 60)]
+
+
+def decode_loop(j):
+    """Décodage historique de pxweb_fetch (référence)."""
+    values = j.get("value", [])
+    dims = j.get("dimension", {})
+    categories = []
+    for dim_id in j.get("id", []):
+        cats = dims[dim_id]["category"]["index"]
+        labels = dims[dim_id]["category"].get("label", {})
+        categories.append((dim_id, sorted(cats, key=lambda k: cats[k]), labels))
+    rows = []
+    for i, combo in enumerate(product(*[codes for (_, codes, _) in categories])):
+        row = {}
+        for (dim_id, codes, labels), code_val in zip(categories, combo):
+            row[dim_id] = labels.get(code_val, code_val)
+        row["value"] = values[i] if i < len(values) else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def timeit(fn, arg, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-cells", type=int, default=3_000_000,
+                        help="ignore la boucle historique au-delà de ce nombre de cellules")
+    args = parser.parse_args()
+
+    print(f"{'cellules':>10} {'boucle (s)':>11} {'vectorisé (s)':>14} {'gain':>7} {'Mo (vect.)':>11}")
+    for shape in SHAPES:
+        cube = synthetic_cube(shape)
+        n = int(np.prod(shape))
+        t_vec, df_vec = timeit(decode_jsonstat, cube, args.repeat)
+        mem = df_vec.memory_usage(deep=True).sum() / 1e6
+        if n <= args.max_cells:
+            t_loop, df_loop = timeit(decode_loop, cube, 1)
+            # Contrôle d'équivalence : mêmes labels, mêmes valeurs
+            for col in cube["id"]:
+                assert (df_loop[col].to_numpy() == df_vec[col].astype(str).to_numpy()).all(), col
+            np.testing.assert_array_equal(pd.to_numeric(df_loop["value"]).to_numpy(dtype=float), df_vec["value"].to_numpy())
+            print(f"{n:>10,} {t_loop:>11.3f} {t_vec:>14.3f} {t_loop / t_vec:>6.1f}x {mem:>11.1f}")
+        else:
+            print(f"{n:>10,} {'-':>11} {t_vec:>14.3f} {'-':>7} {mem:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
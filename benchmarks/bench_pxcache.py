@@ -0,0 +1,68 @@
+"""
+Cache disque PxWeb contre le serveur local (stub) : latence d'un appel
+réseau (miss), d'une lecture disque (hit), d'une entrée périmée servie
+pendant la revalidation (stale) et d'une entrée expirée (expiry).
+
+Usage : python benchmarks/bench_pxcache.py [--shape 200 30 20]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from engine.pxcache import PxCache  # noqa: E402
+from engine.pxweb import fetch_jsonstat  # noqa: E402
+from stub_pxweb import StubTable, serve  # noqa: E402
+
+QUERY = {"query": [], "response": {"format": "json-stat"}}
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - t0) * 1000, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shape", type=int, nargs=3, default=[200, 30, 20])
+    args = parser.parse_args()
+
+    server, url, hits = serve(StubTable(args.shape))
+    with tempfile.TemporaryDirectory() as root:
+        cache = PxCache(root, ttl=0.5, stale_ttl=0.5)
+        call = lambda: cache.fetch(url, QUERY, fetch_jsonstat)  # noqa: E731
+
+        ms, df = timed(call)
+        assert hits["post"] == 1
+        print(f"miss    {ms:8.1f} ms  ({len(df):,} lignes, POST={hits['post']})")
+
+        ms, _ = timed(call)
+        assert hits["post"] == 1
+        print(f"hit     {ms:8.1f} ms  (POST={hits['post']})")
+
+        # Nouveau processus simulé : une autre instance lit le même répertoire
+        ms, _ = timed(lambda: PxCache(root).fetch(url, QUERY, fetch_jsonstat))
+        assert hits["post"] == 1
+        print(f"restart {ms:8.1f} ms  (POST={hits['post']})")
+
+        time.sleep(0.6)
+        ms, _ = timed(call)
+        print(f"stale   {ms:8.1f} ms  (servi depuis le disque, revalidation en arrière-plan)")
+        deadline = time.time() + 10
+        while hits["post"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert hits["post"] == 2
+
+        time.sleep(1.2)
+        ms, _ = timed(call)
+        assert hits["post"] == 3
+        print(f"expiry  {ms:8.1f} ms  (POST={hits['post']})")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+Test de charge : N sessions simultanées contre une réplique de app.py.
+
+Chaque passage (mode × nombre de sessions) démarre un serveur `streamlit run`
+neuf, puis pilote N clients websocket qui parlent le protocole du
+navigateur (BackMsg / ForwardMsg) : changement de mode de données, plage
+d'années (`sel_years`), intensité du scénario (rerun du fragment
+d'analyse), export (téléchargement différé), et selon le mode, requête
+PxWeb ou dépôt de fichier. PxWeb est remplacé par le stub local
+(cf. stub_pxweb.py), préchargé dans le cache disque par `python -m engine
+prefetch` ; l'entrepôt est rempli par `python -m engine fictive / ingest`.
+
+Rapport par mode : latence de rerun p50 / p95 / p99 (envoi -> fin du
+script côté serveur) sur les seuls reruns d'interaction (RERUN_STEPS),
+débit (interactions/s) et pic de mémoire résidente du serveur (VmHWM,
+Linux). Ouverture (caches froids), export et dépôt HTTP sont rapportés à
+part, sur leurs propres lignes. Un serveur par passage : caches froids et pic
+de RSS propre à chaque mode.
+
+AppTest n'est pas utilisable ici : il remplace le Runtime global à chaque
+run et ne supporte pas plusieurs sessions concurrentes dans un processus.
+
+Usage :
+  python benchmarks/load_sessions.py --sessions 1,8,32 --iterations 5
+  python benchmarks/load_sessions.py --modes fictif,pxweb --sessions 16 --think 0 --json charge.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from stub_pxweb import StubTable, serve  # noqa: E402
+from synthetic import CUBE_SHAPES, SCALES, as_raw_file, synthetic_scale  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "app.py"
+# nom -> libellé du choix de source dans la barre latérale de l'app
+MODES = {
+    "fictif": "Données fictives",
+    "pxweb": "Données en ligne",
+    "fichier": "Fichier (CSV/XLSX)",
+    "entrepot": "Entrepôt local (toutes sources)",
+}
+PX_QUERY = {"query": []}
+RERUN_TIMEOUT = 120.0
+# Étapes qui sont des reruns de script déclenchés par une interaction : seules
+# à entrer dans les percentiles de tête (pas l'ouverture, l'export ni l'envoi HTTP)
+RERUN_STEPS = ("mode", "requete", "interroger", "upload", "sel_years", "intensite")
+STARTUP_TIMEOUT = 60.0
+
+
+class SessionError(RuntimeError):
+    pass
+
+
+# ---------------------------
+# --------- CLIENT ----------
+# ---------------------------
+class Session:
+    """
+    Un onglet de navigateur simulé : garde les widgets affichés (libellé ->
+    proto, fragment) et l'état de ceux qu'il a modifiés, renvoyé à chaque
+    rerun comme le fait le frontend.
+    """
+
+    def __init__(self, base_url: str, timings: Dict[str, List[float]], errors: List[str]):
+        self.base_url = base_url
+        self.timings = timings
+        self.errors = errors
+        self.ws = None
+        self.session_id = ""
+        self.widgets: Dict[str, tuple] = {}
+        self.states: Dict[str, WidgetState] = {}
+
+    async def connect(self):
+        ws_url = self.base_url.replace("http://", "ws://") + "/_stcore/stream"
+        self.ws = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None,
+                                           open_timeout=RERUN_TIMEOUT)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    # --- messages serveur
+    def _handle(self, msg: ForwardMsg, seen: set):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id or self.session_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            el_type = element.WhichOneof("type")
+            proto = getattr(element, el_type)
+            if el_type == "exception":
+                self.errors.append(f"{proto.type}: {proto.message}")
+            elif el_type == "alert" and proto.format == proto.ERROR:
+                self.errors.append(proto.body)
+            elif "label" in proto.DESCRIPTOR.fields_by_name and proto.id:
+                self.widgets[proto.label] = (el_type, proto, msg.delta.fragment_id)
+                seen.add(proto.id)
+
+    async def _until(self, kind: str, seen: set, match=lambda m: True) -> ForwardMsg:
+        while True:
+            data = await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT)
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            self._handle(msg, seen)
+            if msg.WhichOneof("type") == kind and match(msg):
+                return msg
+
+    # --- interactions
+    def widget(self, label: str) -> tuple:
+        for name, w in self.widgets.items():
+            if name.startswith(label):
+                return w
+        raise SessionError(f"widget introuvable : {label!r}")
+
+    def set(self, label: str, **value) -> WidgetState:
+        """État d'un widget (`string_value=...`, `double_array_value=[...]`, ...), conservé."""
+        _, proto, _ = self.widget(label)
+        ws = WidgetState(id=proto.id)
+        for field, v in value.items():
+            if isinstance(v, list):
+                getattr(ws, field).data[:] = v
+            elif field == "file_uploader_state_value":
+                ws.file_uploader_state_value.CopyFrom(v)
+            else:
+                setattr(ws, field, v)
+        self.states[proto.id] = ws
+        return ws
+
+    def click(self, label: str) -> WidgetState:
+        """Déclencheur (bouton) : envoyé une seule fois, non conservé."""
+        _, proto, _ = self.widget(label)
+        return WidgetState(id=proto.id, trigger_value=True)
+
+    async def rerun(self, step: str, triggers=(), fragment_id: str = ""):
+        """Rerun complet (ou du fragment), chronométré jusqu'à la fin du script."""
+        back = BackMsg()
+        state = back.rerun_script
+        state.query_string = ""
+        state.page_script_hash = ""
+        state.fragment_id = fragment_id
+        state.widget_states.widgets.extend(list(self.states.values()) + list(triggers))
+        if not fragment_id:
+            self.widgets = {}
+        seen: set = set()
+        t0 = time.perf_counter()
+        await self.ws.send(back.SerializeToString())
+        done = ForwardMsg.ScriptFinishedStatus
+        await self._until("script_finished", seen, lambda m: m.script_finished != done.FINISHED_EARLY_FOR_RERUN)
+        self.timings.setdefault(step, []).append(time.perf_counter() - t0)
+        if not fragment_id:
+            # Widgets disparus (changement de mode) : le frontend ne renvoie plus leur état
+            self.states = {k: v for k, v in self.states.items() if k in seen}
+
+    async def set_slider(self, step: str, label: str, values: List[float]):
+        _, _, fragment_id = self.widget(label)
+        self.set(label, double_array_value=values)
+        await self.rerun(step, fragment_id=fragment_id)
+
+    async def export(self):
+        """Clic sur le bouton d'export : exécution différée côté serveur, puis téléchargement."""
+        _, proto, _ = self.widget("💾 Export")
+        back = BackMsg()
+        req = back.backend_operation_request
+        req.request_id = uuid.uuid4().hex
+        req.session_id = self.session_id
+        req.deferred_file.file_id = proto.deferred_file_id
+        t0 = time.perf_counter()
+        await self.ws.send(back.SerializeToString())
+        msg = await self._until("backend_operation_response", set(),
+                                lambda m: m.backend_operation_response.request_id == req.request_id)
+        resp = msg.backend_operation_response
+        if resp.error_msg:
+            self.errors.append(f"export : {resp.error_msg}")
+            return
+        await asyncio.to_thread(_http, "GET", self.base_url + resp.deferred_file.url)
+        self.timings.setdefault("export", []).append(time.perf_counter() - t0)
+
+    async def upload(self, label: str, name: str, data: bytes):
+        """Dépôt d'un fichier : URL d'envoi, PUT multipart, puis rerun avec l'état du widget."""
+        back = BackMsg()
+        back.file_urls_request.request_id = uuid.uuid4().hex
+        back.file_urls_request.file_names.append(name)
+        back.file_urls_request.session_id = self.session_id
+        t0 = time.perf_counter()
+        await self.ws.send(back.SerializeToString())
+        msg = await self._until("file_urls_response", set(),
+                                lambda m: m.file_urls_response.response_id == back.file_urls_request.request_id)
+        urls = msg.file_urls_response.file_urls[0]
+        await asyncio.to_thread(_put_multipart, self.base_url + urls.upload_url, name, data)
+        self.timings.setdefault("upload_http", []).append(time.perf_counter() - t0)
+
+        from streamlit.proto.Common_pb2 import FileUploaderState
+        state = FileUploaderState()
+        info = state.uploaded_file_info.add()
+        info.file_id, info.name, info.size = urls.file_id, name, len(data)
+        info.file_urls.CopyFrom(urls)
+        self.set(label, file_uploader_state_value=state)
+        await self.rerun("upload")
+
+
+def _http(method: str, url: str, body: Optional[bytes] = None, headers: Optional[Dict] = None) -> bytes:
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    with urllib.request.urlopen(req, timeout=RERUN_TIMEOUT) as r:
+        return r.read()
+
+
+def _put_multipart(url: str, name: str, data: bytes):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+            f"Content-Type: text/csv\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    _http("PUT", url, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+# ---------------------------
+# -------- SCÉNARIO ---------
+# ---------------------------
+async def scenario(session: Session, mode: str, ctx: Dict, iterations: int, think: float,
+                   rng: random.Random):
+    """Séquence d'un utilisateur : ouverture, choix du mode, puis filtres / scénario / export."""
+    await session.connect()
+    try:
+        await session.rerun("ouverture")
+        if mode != "fictif":
+            session.set("Choisir la source", string_value=MODES[mode])
+            await session.rerun("mode")
+        if mode == "pxweb":
+            # Table du stub, lue depuis le cache préchargé, puis une requête explicite
+            session.set("URL de la table PxWeb", string_value=ctx["px_url"])
+            session.set("JSON de requête", string_value=json.dumps(PX_QUERY))
+            await session.rerun("requete")
+            await session.rerun("interroger", [session.click("📡 Interroger PxWeb")])
+        elif mode == "fichier":
+            await session.upload("Dépose un CSV", "synthetique.csv", ctx["csv"])
+
+        for _ in range(iterations):
+            _, years, _ = session.widget("Plage d'années")
+            y0 = rng.randint(int(years.min), int(years.max))
+            y1 = rng.randint(y0, int(years.max))
+            await session.set_slider("sel_years", "Plage d'années", [float(y0), float(max(y1, y0))])
+            await _think(think, rng)
+            await session.set_slider("intensite", "Intensité (%)", [float(rng.randint(50, 200))])
+            await _think(think, rng)
+            await session.export()
+            await _think(think, rng)
+    finally:
+        await session.close()
+
+
+async def _think(think: float, rng: random.Random):
+    if think > 0:
+        await asyncio.sleep(rng.expovariate(1 / think))
+
+
+async def drive(base_url: str, mode: str, n_sessions: int, ctx: Dict, iterations: int,
+                think: float, ramp: float, seed: int) -> Dict:
+    timings: Dict[str, List[float]] = {}
+    errors: List[str] = []
+
+    async def one(i: int):
+        rng = random.Random(seed * 1000 + i)
+        await asyncio.sleep(ramp * i / max(n_sessions, 1))
+        try:
+            await scenario(Session(base_url, timings, errors), mode, ctx, iterations, think, rng)
+        except (SessionError, asyncio.TimeoutError, OSError, websockets.WebSocketException) as e:
+            errors.append(f"session {i} : {type(e).__name__} {e}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_sessions)))
+    return {"wall_s": time.perf_counter() - t0, "timings": timings, "errors": errors}
+
+
+# ---------------------------
+# --------- SERVEUR ---------
+# ---------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def proc_memory_mb(pid: int, field: str) -> Optional[float]:
+    """VmRSS / VmHWM (pic) d'un processus en Mo ; None hors Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_server(workdir: Path, env: Dict[str, str]) -> tuple:
+    port = _free_port()
+    log = open(workdir / f"streamlit-{port}.log", "wb")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP),
+         "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+         # Dépôt de fichiers sans jeton XSRF de navigateur (serveur local de test)
+         "--server.enableXsrfProtection", "false"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            _http("GET", base_url + "/_stcore/health")
+            return proc, base_url
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"Le serveur Streamlit n'a pas démarré, cf. {log.name}")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def prepare(workdir: Path, scale: str) -> Dict:
+    """Stub PxWeb, cache préchargé, fichier CSV et entrepôt, partagés par tous les passages."""
+    server, px_url, _ = serve(StubTable(CUBE_SHAPES[scale]))
+    targets = workdir / "tables.json"
+    targets.write_text(json.dumps([{"url": px_url, "query": {**PX_QUERY, "response": {"format": "json-stat"}}}]))
+    csv = as_raw_file(synthetic_scale(scale)).to_csv(index=False).encode("utf-8")
+    (workdir / "synthetique.csv").write_bytes(csv)
+
+    env = {k: v for k, v in os.environ.items() if k != "DATA_WAREHOUSE"}
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")])),
+        "PXWEB_CACHE_DIR": str(workdir / "cache"),
+        "PXWEB_PREFETCH": str(targets),
+        "PXWEB_PREFETCH_INTERVAL": str(24 * 3600),
+    })
+    warehouse = str(workdir / "entrepot.duckdb")
+    for cmd in (["prefetch", "--targets", str(targets), "--warehouse", warehouse],
+                ["fictive", "--warehouse", warehouse],
+                ["ingest", str(workdir / "synthetique.csv"), "--warehouse", warehouse]):
+        subprocess.run([sys.executable, "-m", "engine", *cmd], cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+    return {"stub": server, "px_url": px_url, "csv": csv, "env": env, "warehouse": warehouse}
+
+
+# ---------------------------
+# --------- RAPPORT ---------
+# ---------------------------
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ms = sorted(v * 1000 for v in values)
+    if not ms:
+        return {"p50": float("nan"), "p95": float("nan"), "p99": float("nan")}
+    if len(ms) == 1:
+        return {"p50": ms[0], "p95": ms[0], "p99": ms[0]}
+    q = statistics.quantiles(ms, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+def summarize(mode: str, n_sessions: int, run: Dict, rss_start, rss_peak) -> Dict:
+    all_values = [v for values in run["timings"].values() for v in values]
+    reruns = [v for step in RERUN_STEPS for v in run["timings"].get(step, [])]
+    return {
+        "mode": mode, "sessions": n_sessions,
+        "interactions": len(all_values), "reruns": len(reruns), "errors": len(run["errors"]),
+        **{k: round(v, 1) for k, v in percentiles(reruns).items()},
+        "throughput": round(len(all_values) / run["wall_s"], 2) if run["wall_s"] else 0.0,
+        "rss_start_mb": rss_start and round(rss_start, 1), "rss_peak_mb": rss_peak and round(rss_peak, 1),
+        "steps": {step: {"n": len(values), **{k: round(v, 1) for k, v in percentiles(values).items()}}
+                  for step, values in run["timings"].items()},
+        "error_samples": run["errors"][:5],
+    }
+
+
+def print_row(r: Dict, steps: bool):
+    rss = lambda v: f"{v:>8.0f}" if v is not None else f"{'n/d':>8}"  # noqa: E731
+    print(f"{r['mode']:<9} {r['sessions']:>8} {r['interactions']:>12} {r['errors']:>7} "
+          f"{r['p50']:>8.0f} {r['p95']:>8.0f} {r['p99']:>8.0f} {r['throughput']:>8.1f} "
+          f"{rss(r['rss_start_mb'])} {rss(r['rss_peak_mb'])}")
+    for step, s in r["steps"].items():
+        if steps or step not in RERUN_STEPS:
+            print(f"    {step:<14} n={s['n']:<5} p50 {s['p50']:>7.0f}  p95 {s['p95']:>7.0f}  p99 {s['p99']:>7.0f} ms")
+    for e in r["error_samples"]:
+        print(f"    ! {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", default=",".join(MODES), help=f"parmi {', '.join(MODES)}")
+    parser.add_argument("--sessions", default="1,8", help="nombres de sessions simultanées, ex. 1,8,32")
+    parser.add_argument("--iterations", type=int, default=5, help="cycles années / intensité / export par session")
+    parser.add_argument("--think", type=float, default=0.5, help="temps de réflexion moyen entre actions (s)")
+    parser.add_argument("--ramp", type=float, default=2.0, help="étalement du démarrage des sessions (s)")
+    parser.add_argument("--scale", choices=list(SCALES), default="small",
+                        help="taille du fichier déposé, de l'entrepôt et de la table PxWeb du stub")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", action="store_true", help="détail des latences par étape de rerun aussi")
+    parser.add_argument("--json", type=Path, help="écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        sys.exit(f"Modes inconnus : {', '.join(sorted(unknown))}")
+    counts = [int(n) for n in args.sessions.split(",") if n]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="charge-") as tmp:
+        workdir = Path(tmp)
+        ctx = prepare(workdir, args.scale)
+        print(f"{'mode':<9} {'sessions':>8} {'interactions':>12} {'erreurs':>7} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'débit/s':>8} {'RSS Mo':>8} {'pic Mo':>8}")
+        try:
+            for mode in modes:
+                env = dict(ctx["env"], **({"DATA_WAREHOUSE": ctx["warehouse"]} if mode == "entrepot" else {}))
+                for n in counts:
+                    proc, base_url = start_server(workdir, env)
+                    try:
+                        rss_start = proc_memory_mb(proc.pid, "VmRSS")
+                        run = asyncio.run(drive(base_url, mode, n, ctx, args.iterations,
+                                                args.think, args.ramp, args.seed))
+                        rss_peak = proc_memory_mb(proc.pid, "VmHWM")
+                    finally:
+                        stop_server(proc)
+                    results.append(summarize(mode, n, run, rss_start, rss_peak))
+                    print_row(results[-1], args.steps)
+        finally:
+            ctx["stub"].shutdown()
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n", "utf-8")
+    if any(r["errors"] for r in results):
+        sys.exit("Des interactions ont échoué (cf. ci-dessus).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Suite de benchmarks de toutes les étapes du pipeline de l'app, sans UI.
+
+Jeux synthétiques (cf. synthetic.py) à l'échelle choisie, cube json-stat
+servi par le stub PxWeb local (cf. stub_pxweb.py). Chaque étape est
+chronométrée `--repeat` fois après un tour d'échauffement ; on retient la
+médiane. Les résultats peuvent être enregistrés comme référence
+(`--save-baseline`) puis comparés (`--check`) : code de sortie 1 si une
+étape dépasse la référence de plus de son seuil de régression.
+
+Benchmarks ciblés conservés à côté : bench_jsonstat.py (décodeur
+vectorisé vs boucle historique), bench_pxcache.py (cache disque),
+load_sessions.py (sessions simultanées contre un serveur Streamlit).
+
+Usage :
+  python benchmarks/run_suite.py --scale small --save-baseline
+  python benchmarks/run_suite.py --scale medium --check
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from engine.aggregates import build_cube, slice_cube  # noqa: E402
+from engine.charts import PER_PAGE, timeline_figures  # noqa: E402
+from engine.datastore import last_year_rows, view_mask  # noqa: E402
+from engine.export import export_bytes  # noqa: E402
+from engine.ingest import compact_long, normalize_file, read_upload  # noqa: E402
+from engine.network import compute_layout, impact_edges, network_figure, topology  # noqa: E402
+from engine.pxweb import decode_jsonstat, fetch_chunked  # noqa: E402
+from engine.scenario import project  # noqa: E402
+from engine.trends import rank_series, series_stats  # noqa: E402
+from stub_pxweb import StubTable, serve, synthetic_cube  # noqa: E402
+from synthetic import CUBE_SHAPES, SCALES, as_raw_file, synthetic_scale  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# Ralentissement toléré (fraction de la référence) ; étapes réseau plus bruitées
+DEFAULT_THRESHOLD = 0.5
+THRESHOLDS = {"pxweb_fetch": 1.0, "pxweb_fetch_split_status": 1.0, "network_layout": 1.0}
+# Écarts absolus sous ce seuil ignorés (bruit de mesure)
+NOISE_MS = 5.0
+# Actions affichées dans l'UI (timeline, réseau) : une sélection, pas tout le jeu
+UI_ACTIONS = 10
+
+
+class NamedBytes(io.BytesIO):
+    """Imite un fichier déposé dans st.file_uploader (attribut `.name`)."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def build_context(scale: str) -> Dict:
+    """Données préparées hors chronométrage, partagées par les étapes."""
+    raw = synthetic_scale(scale)
+    df = compact_long(raw)
+    actions = sorted(df["action"].unique())
+    selected = actions[: max(2, len(actions) // 10)]
+    years = (int(df["annee"].min()), int(df["annee"].max()))
+    cube = build_cube(df)
+    view = slice_cube(cube, selected, years)
+    ui_view = slice_cube(cube, selected[:UI_ACTIONS], years)
+    mask = view_mask(df, selected, years)
+    df_last = last_year_rows(df, view_mask(df, selected[:UI_ACTIONS], years))
+    df_last = df_last.assign(proj=df_last["valeur"] * 1.2)  # intensité 120 %, comme dans l'UI
+
+    server, url, _ = serve(StubTable(CUBE_SHAPES[scale]))
+    # Même cube, limite de cellules du serveur au quart : 4+ morceaux, un seul avec un symbole ".."
+    shape = CUBE_SHAPES[scale]
+    split_server, split_url, _ = serve(StubTable(shape, max_cells=int(np.prod(shape)) // 4,
+                                                 missing=[(0, 0, 0)]))
+    raw_file = as_raw_file(raw)
+    return {
+        "raw": raw, "df": df, "selected": selected, "years": years, "cube": cube,
+        "view": view, "ui_view": ui_view, "mask": mask, "df_last": df_last,
+        "edges": impact_edges(df_last),
+        "ui_indicators": list(ui_view.index.get_level_values("indicateur").unique()[:PER_PAGE]),
+        "server": server, "url": url, "split_server": split_server, "split_url": split_url,
+        "query": {"query": [], "response": {"format": "json-stat"}},
+        "jsonstat": synthetic_cube(CUBE_SHAPES[scale]),
+        "raw_file": raw_file,
+        "csv_bytes": raw_file.to_csv(index=False).encode("utf-8"),
+    }
+
+
+# nom -> fonction(ctx), dans l'ordre du pipeline
+STAGES: Dict[str, Callable[[Dict], object]] = {
+    "pxweb_fetch": lambda c: fetch_chunked(c["url"], c["query"]),
+    "pxweb_fetch_split_status": lambda c: fetch_chunked(c["split_url"], c["query"]),
+    "pxweb_decode": lambda c: decode_jsonstat(c["jsonstat"]),
+    "normalize_file": lambda c: normalize_file(c["raw_file"].copy(deep=False)),
+    "read_upload_csv": lambda c: read_upload(NamedBytes(c["csv_bytes"], "synthetique.csv")),
+    "compact_long": lambda c: compact_long(c["raw"]),
+    "build_cube": lambda c: build_cube(c["df"]),
+    "view_filter": lambda c: (view_mask(c["df"], c["selected"], c["years"]),
+                              slice_cube(c["cube"], c["selected"], c["years"])),
+    "last_year_rows": lambda c: last_year_rows(c["df"], c["mask"]),
+    "kpi_trends_all_series": lambda c: rank_series(series_stats(c["cube"]), "Variation (%)"),
+    "projection": lambda c: project(c["view"], {}, horizon=5, n_sims=500),
+    "timeline_figure": lambda c: timeline_figures(c["ui_view"], c["ui_indicators"]),
+    "network_layout": lambda c: compute_layout(topology(impact_edges(c["df_last"])), "auto"),
+    "network_figure": lambda c: network_figure(c["edges"], compute_layout(topology(c["edges"]), "bipartite")),
+    "export_csv_gz": lambda c: export_bytes(c["df"][c["mask"]], "CSV (gzip)"),
+    "export_parquet": lambda c: export_bytes(c["df"][c["mask"]], "Parquet"),
+}
+
+
+def time_stage(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    fn()  # échauffement (imports paresseux, caches de métadonnées)
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t0) * 1000)
+    return {"ms": round(statistics.median(runs), 3), "min_ms": round(min(runs), 3)}
+
+
+def run(scale: str, repeat: int, only: List[str] = ()) -> Dict[str, Dict[str, float]]:
+    ctx = build_context(scale)
+    print(f"Échelle {scale} : {len(ctx['df']):,} lignes, {ctx['df']['action'].nunique():,} actions, "
+          f"{ctx['df']['indicateur'].nunique():,} indicateurs, cube json-stat {CUBE_SHAPES[scale]}")
+    results = {}
+    try:
+        for name, stage in STAGES.items():
+            if only and name not in only:
+                continue
+            results[name] = time_stage(lambda: stage(ctx), repeat)
+            print(f"  {name:<24} {results[name]['ms']:>10.1f} ms")
+    finally:
+        ctx["server"].shutdown()
+        ctx["split_server"].shutdown()
+    return results
+
+
+def check(results: Dict, baseline: Dict, scale: str) -> List[str]:
+    """Étapes en régression par rapport à la référence de l'échelle."""
+    ref = baseline.get("scales", {}).get(scale, {})
+    thresholds = {**THRESHOLDS, **baseline.get("thresholds", {})}
+    failures = []
+    for name, r in results.items():
+        if name not in ref:
+            continue
+        limit = ref[name]["ms"] * (1 + thresholds.get(name, thresholds.get("default", DEFAULT_THRESHOLD)))
+        ratio = r["ms"] / ref[name]["ms"] if ref[name]["ms"] else float("inf")
+        flag = r["ms"] > limit and r["ms"] - ref[name]["ms"] > NOISE_MS
+        print(f"  {name:<24} {r['ms']:>10.1f} ms  (réf. {ref[name]['ms']:.1f} ms, x{ratio:.2f}){'  <-- RÉGRESSION' if flag else ''}")
+        if flag:
+            failures.append(name)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="étapes séparées par des virgules")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="enregistre les résultats comme référence")
+    parser.add_argument("--check", action="store_true", help="compare à la référence (code 1 si régression)")
+    parser.add_argument("--json", type=Path, help="écrit les résultats bruts dans ce fichier")
+    args = parser.parse_args()
+
+    only = [s for s in args.only.split(",") if s]
+    results = run(args.scale, args.repeat, only)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), "utf-8")
+
+    baseline = json.loads(args.baseline.read_text("utf-8")) if args.baseline.exists() else {}
+    if args.check:
+        print(f"Comparaison à {args.baseline} :")
+        failures = check(results, baseline, args.scale)
+        if failures:
+            sys.exit(f"Régressions : {', '.join(failures)}")
+    if args.save_baseline:
+        baseline.setdefault("thresholds", {"default": DEFAULT_THRESHOLD, **THRESHOLDS})
+        baseline["machine"] = {"python": platform.python_version(), "platform": platform.platform(),
+                               "processor": platform.processor() or platform.machine()}
+        baseline.setdefault("scales", {})[args.scale] = results
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n", "utf-8")
+        print(f"Référence {args.scale} enregistrée dans {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
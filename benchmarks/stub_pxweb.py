@@ -0,0 +1,205 @@
+"""
+Serveur HTTP local qui imite une table PxWeb (API v1) pour les benchmarks.
+
+- GET  <url> : métadonnées de la table (variables, valeurs, libellés)
+- GET  /api/v1/?config : limites annoncées (maxValues, maxCalls, timeWindow)
+- POST <url> : requête PxWeb (filtres "item", "all", "top") -> json-stat,
+  403 au-delà de `max_cells` cellules, 429 au-delà de `rate_limit` requêtes
+  par fenêtre de `rate_window` secondes (comme stat.hel.fi)
+
+Les valeurs sont tirées une fois pour tout le cube : deux requêtes qui se
+recouvrent renvoient les mêmes cellules.
+
+Usage : python benchmarks/stub_pxweb.py --shape 100 30 20 --port 8765
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DIM_NAMES = ["Alue", "Vuosi", "Tiedot"]
+
+
+def synthetic_dimensions(shape, names=DIM_NAMES):
+    """[(code, [valeurs], {valeur: libellé})] ; 'Vuosi' prend des années."""
+    dims = []
+    for name, size in zip(names, shape):
+        if name == "Vuosi":
+            codes = [str(2025 - size + i) for i in range(size)]
+            labels = {c: c for c in codes}
+        else:
+            codes = [f"{name[:1]}{i}" for i in range(size)]
+            labels = {c: f"{name} {c}" for c in codes}
+        dims.append((name, codes, labels))
+    return dims
+
+
+def jsonstat(dims, values, status=None):
+    """Réponse json-stat (v2, à plat) pour des dimensions et valeurs données."""
+    out = {
+        "class": "dataset",
+        "version": "2.0",
+        "id": [name for name, _, _ in dims],
+        "size": [len(codes) for _, codes, _ in dims],
+        "dimension": {
+            name: {"category": {"index": {c: i for i, c in enumerate(codes)},
+                                "label": {c: labels[c] for c in codes}}}
+            for name, codes, labels in dims
+        },
+        "value": values,
+    }
+    if status:
+        out["status"] = status
+    return out
+
+
+def synthetic_cube(shape, null_ratio=0.05, seed=0):
+    """Réponse json-stat synthétique complète de dimensions `shape`."""
+    rng = np.random.default_rng(seed)
+    n = int(np.prod(shape))
+    vals = rng.normal(1000, 100, n).round(1)
+    mask = rng.random(n) < null_ratio
+    value = [None if m else float(v) for v, m in zip(vals, mask)]
+    status = {str(i): ".." for i in np.flatnonzero(mask)}
+    return jsonstat(synthetic_dimensions(shape), value, status)
+
+
+class StubTable:
+    """Cube synthétique interrogeable comme une table PxWeb."""
+
+    def __init__(self, shape, seed=0, title="Table synthétique", max_cells=None,
+                 rate_limit=None, rate_window=10.0, missing=()):
+        self.title = title
+        self.max_cells = max_cells
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.dims = synthetic_dimensions(shape)
+        rng = np.random.default_rng(seed)
+        self.cube = rng.normal(1000, 100, tuple(shape)).round(1)
+        # Cellules manquantes (indices) : valeur nulle + symbole ".." dans `status`,
+        # seulement dans les réponses qui les contiennent (comme PxWeb)
+        for cell in missing:
+            self.cube[tuple(cell)] = np.nan
+
+    def metadata(self):
+        return {
+            "title": self.title,
+            "variables": [
+                {"code": name, "text": name, "values": codes,
+                 "valueTexts": [labels[c] for c in codes], "time": name == "Vuosi"}
+                for name, codes, labels in self.dims
+            ],
+        }
+
+    def config(self):
+        return {"apiVersion": "1.1.0", "maxValues": self.max_cells or 10**9,
+               "maxCalls": self.rate_limit or 10**6, "timeWindow": self.rate_window}
+
+    def select(self, query):
+        sel = {q["code"]: q["selection"] for q in query.get("query", [])}
+        dims, idx = [], []
+        for name, codes, labels in self.dims:
+            s = sel.get(name)
+            if s is None or s.get("filter") == "all":
+                keep = list(range(len(codes)))
+            elif s.get("filter") == "top":
+                keep = list(range(len(codes)))[-int(s["values"][0]):]
+            else:
+                wanted = set(s.get("values", []))
+                keep = [i for i, c in enumerate(codes) if c in wanted]
+            dims.append((name, [codes[i] for i in keep], labels))
+            idx.append(keep)
+        cube = self.cube[np.ix_(*idx)].ravel()
+        nulls = np.flatnonzero(np.isnan(cube))
+        values = [None if np.isnan(v) else v for v in cube.tolist()] if len(nulls) else cube.tolist()
+        return jsonstat(dims, values, {str(i): ".." for i in nulls})
+
+    def cells(self, query):
+        sel = {q["code"]: q["selection"] for q in query.get("query", [])}
+        n = 1
+        for name, codes, _ in self.dims:
+            s = sel.get(name)
+            if s is None or s.get("filter") == "all":
+                n *= len(codes)
+            elif s.get("filter") == "top":
+                n *= min(len(codes), int(s["values"][0]))
+            else:
+                n *= len(set(s.get("values", [])) & set(codes))
+        return n
+
+
+def make_handler(table, state):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.endswith("?config"):
+                self._send(200, table.config())
+                return
+            with state["lock"]:
+                state["get"] += 1
+            self._send(200, table.metadata())
+
+        def do_POST(self):
+            query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state["lock"]:
+                now = time.monotonic()
+                state["recent"] = [t for t in state["recent"] if now - t < table.rate_window]
+                if table.rate_limit and len(state["recent"]) >= table.rate_limit:
+                    state["throttled"] += 1
+                    throttled = True
+                else:
+                    state["recent"].append(now)
+                    state["post"] += 1
+                    throttled = False
+            if throttled:
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            elif table.max_cells and table.cells(query) > table.max_cells:
+                self._send(403, {"error": "Too many values selected"})
+            else:
+                self._send(200, table.select(query))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(table, port=0):
+    """Démarre le serveur dans un thread ; retourne (server, url, compteurs)."""
+    state = {"get": 0, "post": 0, "throttled": 0, "recent": [], "lock": threading.Lock()}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(table, state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/fi/stub.px", state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur PxWeb local (stub)")
+    parser.add_argument("--shape", type=int, nargs=3, default=[100, 30, 20])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-cells", type=int, default=None)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requêtes par fenêtre de 10 s")
+    args = parser.parse_args()
+    table = StubTable(args.shape, max_cells=args.max_cells, rate_limit=args.rate_limit)
+    server, url, _ = serve(table, args.port)
+    print(f"PxWeb stub : {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
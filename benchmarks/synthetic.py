@@ -0,0 +1,97 @@
+"""
+Générateur de jeux synthétiques au schéma des données fictives de l'app
+(source, action, indicateur, annee, valeur), à l'échelle de millions de
+lignes et de milliers d'actions / indicateurs.
+
+Chaque action agit sur `per_action` indicateurs tirés parmi `n_indicators` ;
+chaque série suit une tendance géométrique bruitée comme les séries de
+`load_fictive_data`, avec quelques sauts isolés (anomalies).
+
+Usage : python benchmarks/synthetic.py --scale medium --out synthetic.parquet
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# nom -> (actions, indicateurs, indicateurs par action, années)
+SCALES = {
+    "small": (200, 50, 5, 10),         # 10 k lignes
+    "medium": (2_000, 500, 10, 25),    # 500 k lignes
+    "large": (5_000, 2_000, 20, 30),   # 3 M lignes
+}
+# json-stat (Alue, Vuosi, Tiedot) servi par le stub pour chaque échelle
+CUBE_SHAPES = {
+    "small": (50, 10, 5),
+    "medium": (500, 30, 20),
+    "large": (1_000, 50, 60),
+}
+LAST_YEAR = 2024
+
+
+def synthetic_long(n_actions: int, n_indicators: int, per_action: int, n_years: int,
+                   seed: int = 0, anomaly_ratio: float = 0.01) -> pd.DataFrame:
+    """Tableau long synthétique de n_actions × per_action × n_years lignes."""
+    rng = np.random.default_rng(seed)
+    per_action = min(per_action, n_indicators)
+    n_series = n_actions * per_action
+    actions = np.repeat(np.arange(n_actions), per_action)
+    # Indicateurs distincts par action : décalage aléatoire + pas premier avec n_indicators
+    offset = rng.integers(0, n_indicators, n_actions)
+    indicators = (offset[:, None] + np.arange(per_action)[None] * 7919) % n_indicators
+    indicators = indicators.ravel()
+
+    base = rng.lognormal(7, 1.5, n_series)
+    growth = rng.normal(-0.03, 0.05, n_series)
+    t = np.arange(n_years)
+    noise = rng.normal(0, 0.03, (n_series, n_years))
+    values = base[:, None] * np.exp(growth[:, None] * t[None] + noise)
+    spikes = rng.random((n_series, n_years)) < anomaly_ratio
+    values[spikes] *= rng.choice([0.3, 3.0], spikes.sum())
+
+    action_names = np.array([f"Action {i:05d}" for i in range(n_actions)], dtype=object)
+    ind_names = np.array([f"Indicateur {i:05d}" for i in range(n_indicators)], dtype=object)
+    return pd.DataFrame({
+        "source": "Synthétique",
+        "action": np.repeat(action_names[actions], n_years),
+        "indicateur": np.repeat(ind_names[indicators], n_years),
+        "annee": np.tile(np.arange(LAST_YEAR - n_years + 1, LAST_YEAR + 1), n_series),
+        "valeur": values.ravel().round(1),
+    })
+
+
+def synthetic_scale(scale: str, seed: int = 0) -> pd.DataFrame:
+    return synthetic_long(*SCALES[scale], seed=seed)
+
+
+def as_raw_file(df: pd.DataFrame) -> pd.DataFrame:
+    """Même contenu avec des en-têtes de fichier « réel » (cf. ingest.column_mapping)."""
+    return df.drop(columns="source").rename(
+        columns={"action": "Action", "indicateur": "Indicateur", "annee": "Vuosi", "valeur": "Arvo"}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=list(SCALES), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, required=True, help=".parquet, .feather ou .csv")
+    args = parser.parse_args()
+
+    df = synthetic_scale(args.scale, args.seed)
+    suffix = args.out.suffix.lower()
+    if suffix == ".csv":
+        as_raw_file(df).to_csv(args.out, index=False)
+    elif suffix == ".feather":
+        df.to_feather(args.out)
+    elif suffix == ".parquet":
+        df.to_parquet(args.out, index=False)
+    else:
+        sys.exit(f"Extension non prise en charge : {suffix}")
+    print(f"{len(df):,} lignes -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+Cœur de l'app, sans Streamlit : sources (PxWeb, fichiers, jeu fictif),
+cache disque, entrepôt local, agrégats, tendances, projections, graphiques
+et export. Importable par l'app, les scripts de benchmarks et la ligne de
+commande (`python -m engine`, cf. cli.py).
+
+Aucun sous-module n'est importé ici : chacun ne charge que ce dont il a
+besoin, et les dépendances lourdes (plotly, requests, networkx, pyarrow,
+openpyxl, duckdb) ne sont importées qu'au premier usage.
+"""
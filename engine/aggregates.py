@@ -0,0 +1,37 @@
+"""
+Cube d'agrégats de 'valeur' indexé par (indicateur, action, annee).
+
+Calculé une fois par jeu de données : les filtres de l'UI (actions, plage
+d'années) et les KPI travaillent ensuite sur ce cube, beaucoup plus petit
+que le tableau long, au lieu de refaire un filtre booléen par indicateur.
+"""
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+CUBE_LEVELS = ["indicateur", "action", "annee"]
+
+
+def build_cube(df: pd.DataFrame) -> pd.Series:
+    """Somme de 'valeur' par (indicateur, action, annee), index trié."""
+    return (
+        df.groupby(CUBE_LEVELS, observed=True, sort=True)["valeur"].sum()
+        .astype(np.float64)
+    )
+
+
+def slice_cube(cube: pd.Series, actions: Iterable, years: Tuple[int, int]) -> pd.Series:
+    """Sous-cube des actions sélectionnées sur la plage d'années (bornes incluses)."""
+    idx = cube.index
+    annee = idx.get_level_values("annee")
+    mask = (
+        idx.get_level_values("action").isin(list(actions))
+        & (annee >= years[0]) & (annee <= years[1])
+    )
+    return cube[mask]
+
+
+def timeline(view: pd.Series, indicateur) -> pd.DataFrame:
+    """Série (annee, action, valeur) d'un indicateur, lue par index."""
+    return view.xs(indicateur, level="indicateur").reset_index()
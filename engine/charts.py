@@ -0,0 +1,124 @@
+"""
+Figures de l'évolution temporelle : rendu WebGL (Scattergl), séries
+sous-échantillonnées côté serveur (LTTB) à un budget de points, et option
+d'une figure unique à sous-graphiques paginés. Les bandes de projection
+(percentiles Monte Carlo, cf. scenario.py) prolongent chaque série.
+"""
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import timeline
+from .perf import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+MAX_POINTS = 800
+PER_PAGE = 6
+ROW_HEIGHT = 320
+# plotly.colors.qualitative.Plotly, recopiée : plotly n'est importé qu'au premier tracé
+PALETTE = ["#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A",
+           "#19D3F3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52"]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets : indices de `n_out` points qui conservent
+    la forme de la série (premier et dernier points inclus). x croissant.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Moyenne du bucket suivant (ou dernier point) comme troisième sommet
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.nanargmax(area)) if np.isfinite(area).any() else lo
+        out[i + 1] = a
+    return out
+
+
+def _band_traces(act, x0, y0, band: pd.DataFrame, color: str) -> list:
+    """Bande p_bas–p_haut (remplie) + médiane pointillée, raccordées au dernier point observé."""
+    qs = [c for c in band.columns if c.startswith("p")]
+    lo, mid, hi = qs[0], qs[len(qs) // 2], qs[-1]
+    x = np.concatenate([[x0], band["annee"].to_numpy()])
+    import plotly.graph_objects as go
+
+    fill = "rgba({},{},{},0.18)".format(*(int(color[i:i + 2], 16) for i in (1, 3, 5)))
+    common = dict(x=x, mode="lines", legendgroup=str(act), showlegend=False, hoverinfo="x+y")
+    return [
+        go.Scatter(y=np.concatenate([[y0], band[lo]]), line=dict(width=0), name=f"{act} {lo}", **common),
+        go.Scatter(y=np.concatenate([[y0], band[hi]]), line=dict(width=0), fill="tonexty",
+                   fillcolor=fill, name=f"{act} {hi}", **common),
+        go.Scatter(y=np.concatenate([[y0], band[mid]]), line=dict(color=color, dash="dot"),
+                   name=f"{act} {mid}", **common),
+    ]
+
+
+def _series_traces(dfi: pd.DataFrame, colors: dict, max_points: int, legend: set,
+                   bands: Optional[pd.DataFrame] = None) -> list:
+    import plotly.graph_objects as go
+
+    traces = []
+    for act, dfa in dfi.groupby("action", observed=True, sort=False):
+        x = dfa["annee"].to_numpy()
+        y = dfa["valeur"].to_numpy(dtype=np.float64)
+        keep = lttb(x, y, max_points)
+        traces.append(go.Scattergl(
+            x=x[keep], y=y[keep], mode="lines+markers" if len(keep) <= 60 else "lines",
+            name=str(act), legendgroup=str(act), showlegend=act not in legend,
+            line=dict(color=colors[act]), marker=dict(color=colors[act]),
+        ))
+        legend.add(act)
+        if bands is not None and act in bands.index and len(x):
+            traces.extend(_band_traces(act, x[-1], y[-1], bands.loc[[act]], colors[act]))
+    return traces
+
+
+def timeline_figures(view: pd.Series, indicators: Sequence, packed: bool = False,
+                     max_points: int = MAX_POINTS, bands: Optional[pd.DataFrame] = None) -> List["go.Figure"]:
+    """
+    Figures des indicateurs donnés à partir du cube filtré : une par
+    indicateur, ou une seule figure à sous-graphiques si `packed`.
+    `bands` : sortie de scenario.project, tracée en prolongement des séries.
+    """
+    import plotly.graph_objects as go
+
+    with span("timeline.figures", rows=len(view), indicators=len(indicators), packed=packed):
+        actions = view.index.get_level_values("action").unique()
+        colors = {a: PALETTE[i % len(PALETTE)] for i, a in enumerate(actions)}
+        series = [(ind, timeline(view, ind)) for ind in indicators]
+        by_ind = {}
+        if bands is not None and len(bands):
+            b = bands[bands["indicateur"].isin(list(indicators))]
+            by_ind = {ind: g.set_index("action") for ind, g in b.groupby("indicateur", observed=True, sort=False)}
+
+        if not packed:
+            figs = []
+            for ind, dfi in series:
+                fig = go.Figure(_series_traces(dfi, colors, max_points, set(), by_ind.get(ind)))
+                fig.update_layout(height=ROW_HEIGHT, margin=dict(l=20,r=20,t=40,b=20), title=str(ind))
+                figs.append(fig)
+            return figs
+
+        from plotly.subplots import make_subplots
+
+        fig = make_subplots(rows=max(1, len(series)), cols=1, subplot_titles=[str(i) for i, _ in series],
+                            vertical_spacing=min(0.08, 0.3 / max(1, len(series))))
+        legend = set()
+        for row, (ind, dfi) in enumerate(series, start=1):
+            for tr in _series_traces(dfi, colors, max_points, legend, by_ind.get(ind)):
+                fig.add_trace(tr, row=row, col=1)
+        fig.update_layout(height=ROW_HEIGHT * max(1, len(series)) * 0.8, margin=dict(l=20,r=20,t=40,b=20))
+        return [fig]
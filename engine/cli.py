@@ -0,0 +1,117 @@
+"""
+Ligne de commande sans interface : préchargement PxWeb, ingestion de
+fichiers et du jeu fictif dans l'entrepôt local. Même configuration que
+l'app (PXWEB_CACHE_*, PXWEB_PREFETCH, DATA_WAREHOUSE) ; les clés de jeux
+versés dans l'entrepôt sont celles de l'app.
+
+Usage :
+  python -m engine prefetch [--targets tables.json] [--loop] [--warehouse data/entrepot.duckdb]
+  python -m engine ingest fichier.csv [autre.xlsx ...] --warehouse data/entrepot.duckdb
+  python -m engine fictive --warehouse data/entrepot.duckdb
+"""
+import argparse
+import os
+import sys
+import time
+
+from . import perf
+
+
+def _warehouse(path):
+    if not path:
+        return None
+    from .warehouse import Warehouse
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return Warehouse(path)
+
+
+def cmd_prefetch(args):
+    from .prefetch import Prefetcher, format_age, interval_from_env, load_targets, targets_from_env
+    from .pxcache import cache_from_env, cache_key
+    from .pxweb import fetch_chunked
+    from .sources import pxweb_to_long
+
+    targets = load_targets(args.targets) if args.targets else targets_from_env()
+    if not targets:
+        sys.exit("Aucune table à précharger (PXWEB_PREFETCH=off et pas de --targets).")
+    cache = cache_from_env()
+    wh = _warehouse(args.warehouse)
+    prefetcher = Prefetcher(cache, fetch_chunked, targets, interval=args.interval or interval_from_env())
+    while True:
+        prefetcher.run_once()
+        failed = 0
+        for key, st in prefetcher.status().items():
+            if st["error"]:
+                failed += 1
+                print(f"ÉCHEC {st['url']} : {st['error']}", file=sys.stderr)
+                continue
+            hit = cache.get(key)
+            if hit is None:  # évincée ou illisible juste après l'écriture
+                failed += 1
+                print(f"ÉCHEC {st['url']} : entrée absente du cache après préchargement", file=sys.stderr)
+                continue
+            print(f"OK    {st['url']} : {len(hit[0]):,} cellules, téléchargées il y a {format_age(hit[1])}")
+        if wh is not None:
+            for url, query in targets:
+                hit = cache.get(cache_key(url, query))
+                if hit is not None:
+                    wh.ingest("pxweb:" + cache_key(url, query), pxweb_to_long(hit[0]))
+            print(f"Entrepôt {args.warehouse} : version {wh.version()}")
+        if not args.loop:
+            return 1 if failed else 0
+        time.sleep(prefetcher.interval)
+
+
+def cmd_ingest(args):
+    from .ingest import read_upload, upload_key
+
+    wh = _warehouse(args.warehouse)
+    for path in args.files:
+        with open(path, "rb") as f:  # read_upload attend un fichier nommé (cf. st.file_uploader)
+            key = upload_key(f)
+            df = read_upload(f)
+        wh.ingest(key, df)
+        print(f"{path} : {len(df):,} lignes")
+    print(f"Entrepôt {args.warehouse} : version {wh.version()}")
+    return 0
+
+
+def cmd_fictive(args):
+    from .ingest import compact_long
+    from .sources import load_fictive_data
+
+    wh = _warehouse(args.warehouse)
+    df = compact_long(load_fictive_data()[0])
+    wh.ingest("fictif", df)
+    print(f"Jeu fictif : {len(df):,} lignes -> {args.warehouse} (version {wh.version()})")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m engine", description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    default_wh = os.environ.get("DATA_WAREHOUSE")
+
+    p = sub.add_parser("prefetch", help="télécharge les tables PxWeb configurées dans le cache disque")
+    p.add_argument("--targets", help="fichier JSON de tables (défaut : PXWEB_PREFETCH)")
+    p.add_argument("--loop", action="store_true", help="rafraîchit en continu (toutes les PXWEB_PREFETCH_INTERVAL s)")
+    p.add_argument("--interval", type=float, help="intervalle de rafraîchissement en secondes")
+    p.add_argument("--warehouse", default=default_wh, help="verse aussi les tables dans cet entrepôt")
+    p.set_defaults(func=cmd_prefetch)
+
+    p = sub.add_parser("ingest", help="verse des fichiers CSV/XLSX/Parquet/Feather dans l'entrepôt")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--warehouse", default=default_wh, required=default_wh is None)
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("fictive", help="verse le jeu fictif dans l'entrepôt")
+    p.add_argument("--warehouse", default=default_wh, required=default_wh is None)
+    p.set_defaults(func=cmd_fictive)
+
+    args = parser.parse_args(argv)
+    run = perf.begin_run(f"cli:{args.command}")
+    try:
+        code = args.func(args)
+    finally:
+        perf.end_run(run)
+    sys.exit(code)
@@ -0,0 +1,102 @@
+"""
+Registre de jeux de données partagé entre sessions.
+
+Un jeu de données (tableau long compact : catégories, int16, float32 si exact ;
+chaînes adossées à Arrow sous pandas ≥ 3) est chargé une seule fois par
+processus et partagé par référence entre toutes les sessions : pas de copie
+pickle par appelant comme avec st.cache_data. Les frames du registre sont
+en lecture seule par convention ; chaque session n'en garde qu'un masque de
+lignes et ne matérialise que de petites sélections (dernière année, export).
+
+La mémoire totale est plafonnée : au-delà de `max_bytes`, les jeux les
+moins récemment utilisés sont évincés (et rechargés à la demande).
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Empreinte du contenu (colonnes + valeurs) : versionne les clés des jeux rechargés."""
+    h = hashlib.blake2b(",".join(map(str, df.columns)).encode("utf-8"), digest_size=8)
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class DatasetRegistry:
+    """Jeux de données immuables indexés par clé, plafond mémoire + éviction LRU."""
+
+    def __init__(self, max_bytes: int = 1024 * 2**20):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: str, df: pd.DataFrame) -> pd.DataFrame:
+        size = frame_bytes(df)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (df, size)
+            self._bytes += size
+            # On n'évince jamais l'entrée qu'on vient d'ajouter
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+        return df
+
+    def get_or_load(self, key: str, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Retourne le jeu `key`, en le chargeant une seule fois même si plusieurs sessions le demandent."""
+        df = self.get(key)
+        if df is not None:
+            return df
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                df = self.get(key)
+                if df is None:
+                    df = self.put(key, loader())
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return df
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"datasets": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def view_mask(df: pd.DataFrame, actions: Iterable, years: Tuple[int, int]) -> np.ndarray:
+    """Masque booléen des lignes de la vue (actions sélectionnées, années incluses)."""
+    return (
+        df["action"].isin(list(actions))
+        & df["annee"].between(years[0], years[1], inclusive="both")
+    ).to_numpy(dtype=bool, na_value=False)
+
+
+def last_year_rows(df: pd.DataFrame, mask: np.ndarray) -> pd.DataFrame:
+    """Lignes de la dernière année de la vue : seule petite sélection copiée par session."""
+    annee = df["annee"].to_numpy()
+    if not mask.any():
+        return df.iloc[:0].copy()
+    ymax = annee[mask].max()
+    return df[mask & (annee == ymax)].copy()
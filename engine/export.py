@@ -0,0 +1,75 @@
+"""
+Export de la vue filtrée (CSV gzip, Parquet, Excel).
+
+Les writers écrivent par tranches de lignes dans un fichier temporaire
+(mémoire puis disque au-delà de SPOOL_BYTES) : pas de copie texte complète
+de la vue en mémoire, contrairement à `df.to_csv().encode()`.
+"""
+import gzip
+import io
+import tempfile
+from typing import IO, Callable, Dict, Tuple
+
+import pandas as pd
+
+from .perf import span
+
+CHUNK_ROWS = 100_000
+# Niveau bas : le temps de compression domine sinon la sérialisation
+GZIP_LEVEL = 1
+SPOOL_BYTES = 32 * 2**20
+EXCEL_MAX_ROWS = 1_048_575  # + ligne d'en-tête
+
+# libellé -> (extension, type MIME)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def write_csv_gz(df: pd.DataFrame, out: IO[bytes]):
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=GZIP_LEVEL) as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            df.iloc[start:start + CHUNK_ROWS].to_csv(text, index=False, header=start == 0)
+        text.flush()
+        text.detach()
+
+
+def write_parquet(df: pd.DataFrame, out: IO[bytes]):
+    df.to_parquet(out, index=False, row_group_size=CHUNK_ROWS)
+
+
+def write_excel(df: pd.DataFrame, out: IO[bytes]):
+    from openpyxl import Workbook
+
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel est limité à {EXCEL_MAX_ROWS:,} lignes ({len(df):,} dans la vue) : utilisez CSV ou Parquet.")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("vue")
+    ws.append([str(c) for c in df.columns])
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        # NaN/NA -> cellule vide
+        for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(out)
+
+
+WRITERS: Dict[str, Callable[[pd.DataFrame, IO[bytes]], None]] = {
+    "CSV (gzip)": write_csv_gz,
+    "Parquet": write_parquet,
+    "Excel": write_excel,
+}
+
+
+def export_bytes(df: pd.DataFrame, fmt: str) -> bytes:
+    """Sérialise `df` au format `fmt` (clé de FORMATS)."""
+    with span("export." + FORMATS[fmt][0], rows=len(df)) as s, \
+            tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as buf:
+        WRITERS[fmt](df, buf)
+        buf.seek(0)
+        data = buf.read()
+        s["bytes"] = len(data)
+    return data
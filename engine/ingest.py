@@ -0,0 +1,281 @@
+"""
+Ingestion des fichiers déposés (CSV, Parquet/Feather, XLSX) vers le schéma long
+['source','action','indicateur','annee','valeur'].
+
+Les CSV sont lus uniquement sur les colonnes utiles (moteur pyarrow, ou par
+morceaux avec le moteur C si pyarrow est absent) ; le mapping de
+`normalize_file` est appliqué morceau par morceau, puis les colonnes sont
+compactées (catégories pour les libellés, entiers courts pour l'année,
+float32 pour la valeur quand il la représente exactement, float64 sinon).
+
+Les classeurs XLSX sont lus en mode streaming (openpyxl `read_only`), une
+feuille par processus ; les tableaux "larges" (années en colonnes) sont
+remis au format long avant normalisation.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .perf import span
+from .pxweb import merge_frames
+
+LONG_COLUMNS = ["source", "action", "indicateur", "annee", "valeur"]
+CSV_CHUNK_ROWS = 250_000
+# En dessous de cette taille, lancer des processus coûte plus cher que de lire
+XLSX_PARALLEL_BYTES = 2 * 2**20
+_YEAR = re.compile(r"^\s*((?:19|20)\d{2})(?:\.0)?\s*$")
+
+
+def column_mapping(columns: Iterable[str]) -> Dict[str, str]:
+    """Heuristiques de renommage (colonnes déjà en minuscules) -> schéma long."""
+    mapping = {}
+    for c in columns:
+        if c.startswith("annee") or c in ("year","annee","vuosi","vuodet"):
+            mapping[c] = "annee"
+        if c in ("valeur","value","arvo"):
+            mapping[c] = "valeur"
+        if "action" in c:
+            mapping[c] = "action"
+        if "indicateur" in c or "indicator" in c or "indik" in c:
+            mapping[c] = "indicateur"
+    return mapping
+
+
+def normalize_file(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Essaie de normaliser un fichier 'réel' en colonnes
+    ['source','action','indicateur','annee','valeur'].
+    Si colonnes inconnues, laisse l’utilisateur mapper via l’UI.
+    """
+    with span("ingest.normalize_file", rows=len(df)):
+        cols = [str(c).lower() for c in df.columns]
+        df.columns = cols
+        # Heuristiques fréquentes
+        df = df.rename(columns=column_mapping(df.columns))
+        if "annee" in df.columns and "valeur" in df.columns:
+            if "action" not in df.columns:
+                df["action"] = "Mesure réelle"
+            if "indicateur" not in df.columns:
+                # Essaie de trouver une colonne catégorielle pour l’indicateur
+                cat_cols = [c for c in df.columns if c not in ("annee","valeur","action")]
+                if cat_cols:
+                    df["indicateur"] = df[cat_cols[0]].astype(str)
+                else:
+                    df["indicateur"] = "Indicateur"
+            out = df[["action","indicateur","annee","valeur"]].copy()
+            out["source"] = "Réel (fichier)"
+            return out
+        # sinon, on renverra brut et l’utilisateur mappera via l’UI (non implémenté ici pour aller vite)
+        df["source"] = "Réel (fichier – brut)"
+        return df
+
+
+def needed_columns(columns: List[str]) -> Optional[List[str]]:
+    """
+    Colonnes d'origine utiles à `normalize_file`, ou None si le fichier
+    n'a pas de colonnes année/valeur reconnues (lecture brute complète).
+    """
+    lower = [str(c).lower() for c in columns]
+    mapping = column_mapping(lower)
+    targets = set(mapping.values())
+    if not {"annee", "valeur"} <= targets:
+        return None
+    keep = [orig for orig, low in zip(columns, lower) if low in mapping]
+    if "indicateur" not in targets:
+        renamed = [mapping.get(low, low) for low in lower]
+        cat_cols = [orig for orig, r in zip(columns, renamed) if r not in ("annee","valeur","action")]
+        keep += cat_cols[:1]
+    return keep
+
+
+def compact_long(df: pd.DataFrame) -> pd.DataFrame:
+    """Types compacts pour le schéma long (catégories, int16, float32 si exact)."""
+    if not set(LONG_COLUMNS) <= set(df.columns):
+        return df
+    out = df[LONG_COLUMNS].copy()
+    for c in ("source", "action", "indicateur"):
+        out[c] = out[c].astype("category")
+    annee = pd.to_numeric(out["annee"], errors="coerce")
+    valid = annee.dropna()
+    if ((valid % 1 == 0) & valid.between(-32768, 32767)).all():
+        annee = annee.astype("Int16" if annee.isna().any() else np.int16)
+    out["annee"] = annee
+    out["valeur"] = _compact_values(pd.to_numeric(out["valeur"], errors="coerce"))
+    return out
+
+
+def _compact_values(valeur: pd.Series) -> pd.Series:
+    """float32 seulement si l'aller-retour est exact (entiers < 2**24, demi-unités...), sinon float64."""
+    v = valeur.to_numpy(dtype=np.float64, na_value=np.nan)
+    v32 = v.astype(np.float32)
+    if np.array_equal(v32.astype(np.float64), v, equal_nan=True):
+        return pd.Series(v32, index=valeur.index, name=valeur.name)
+    return pd.Series(v, index=valeur.index, name=valeur.name)
+
+
+def _read_csv(up) -> pd.DataFrame:
+    header = pd.read_csv(up, nrows=0).columns.tolist()
+    up.seek(0)
+    usecols = needed_columns(header)
+    if usecols is None:
+        return normalize_file(pd.read_csv(up))
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        chunks = pd.read_csv(up, usecols=usecols, chunksize=CSV_CHUNK_ROWS)
+        return merge_frames([compact_long(normalize_file(c)) for c in chunks])
+    return compact_long(normalize_file(pd.read_csv(up, usecols=usecols, engine="pyarrow")))
+
+
+def _read_columnar(up, fmt: str) -> pd.DataFrame:
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        names = pq.ParquetFile(up).schema_arrow.names
+    else:
+        names = ipc.open_file(up).schema.names
+    up.seek(0)
+    usecols = needed_columns(names)
+    if fmt == "parquet":
+        table = pq.read_table(up, columns=usecols)
+    else:
+        table = feather.read_table(up, columns=usecols, memory_map=False)
+    df = table.to_pandas(self_destruct=True)
+    if usecols is None:
+        return normalize_file(df)
+    return compact_long(normalize_file(df))
+
+
+# ---------------------------
+# ---------- XLSX -----------
+# ---------------------------
+def year_columns(columns: Iterable) -> Dict[object, int]:
+    """Colonnes dont l'en-tête est une année (2019, "2019", 2019.0) -> année."""
+    out = {}
+    for c in columns:
+        m = _YEAR.match(str(c))
+        if m:
+            out[c] = int(m.group(1))
+    return out
+
+
+def wide_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tableau "large" (années en colonnes) -> colonnes d'identifiants +
+    'annee' + 'valeur', par répétition/tuilage des tableaux NumPy ;
+    les cellules vides sont écartées. Retourne df inchangé s'il a moins de
+    deux colonnes-années.
+    """
+    years = year_columns(df.columns)
+    if len(years) < 2:
+        return df
+    id_cols = [c for c in df.columns if c not in years]
+    values = df[list(years)].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    n_rows, n_years = values.shape
+    data = {str(c): np.repeat(df[c].to_numpy(), n_years) for c in id_cols}
+    data["annee"] = np.tile(np.fromiter(years.values(), dtype=np.int16, count=n_years), n_rows)
+    data["valeur"] = values.ravel()
+    out = pd.DataFrame(data)
+    return out[out["valeur"].notna()].reset_index(drop=True)
+
+
+def _sheet_frame(rows: List[Tuple]) -> pd.DataFrame:
+    """Lignes brutes d'une feuille -> DataFrame, en sautant les lignes de titre."""
+    rows = [r for r in rows if any(v is not None for v in r)]
+    if not rows:
+        return pd.DataFrame()
+    # En-tête = première ligne (parmi les 20 premières) portant au moins deux années :
+    # une feuille large dont la cellule en haut à gauche est vide a autant de cellules
+    # remplies dans son en-tête que dans ses lignes de données. À défaut, la plus remplie.
+    head = rows[:20]
+    h = next((i for i, r in enumerate(head) if len(year_columns(v for v in r if v is not None)) >= 2), None)
+    if h is None:
+        counts = [sum(v is not None for v in r) for r in head]
+        h = counts.index(max(counts))
+    header = [str(v) if v is not None else f"col{i}" for i, v in enumerate(rows[h])]
+    return pd.DataFrame(rows[h + 1:], columns=header)
+
+
+def _read_sheet(data: bytes, sheet: str) -> Tuple[str, pd.DataFrame]:
+    """Lit une feuille en streaming et la normalise (exécuté dans un processus)."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        df = _sheet_frame(list(wb[sheet].iter_rows(values_only=True)))
+    finally:
+        wb.close()
+    return sheet, normalize_file(wide_to_long(df))
+
+
+def read_xlsx(data: bytes, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Lit toutes les feuilles d'un classeur (processus parallèles pour les gros
+    fichiers) et concatène celles qui ont pu être normalisées ; l'indicateur
+    est préfixé par le nom de la feuille quand il y en a plusieurs.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True)
+    sheets = wb.sheetnames
+    wb.close()
+    workers = workers or min(len(sheets), os.cpu_count() or 1)
+    if workers > 1 and len(data) >= XLSX_PARALLEL_BYTES:
+        # "spawn" : pas de fork d'un serveur Streamlit multi-thread
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_read_sheet, [data] * len(sheets), sheets))
+    else:
+        results = [_read_sheet(data, sh) for sh in sheets]
+
+    frames = []
+    for sheet, df in results:
+        if set(LONG_COLUMNS) <= set(df.columns) and len(df):
+            if len(sheets) > 1:
+                df["indicateur"] = sheet + " – " + df["indicateur"].astype(str)
+            frames.append(compact_long(df))
+    if not frames:
+        return results[0][1]  # brut : l'utilisateur mappera via l'UI
+    return merge_frames(frames)
+
+
+def upload_key(up) -> str:
+    """
+    Clé de jeu d'un fichier déposé : empreinte du contenu. Le même fichier
+    redéposé, par une autre session ou via la ligne de commande, reprend la
+    même clé (et remplace ses lignes dans l'entrepôt au lieu de les doubler).
+    """
+    pos = up.tell()
+    up.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: up.read(2**20), b""):
+        h.update(chunk)
+    up.seek(pos)
+    return "file:" + h.hexdigest()[:32]
+
+
+def read_upload(up) -> pd.DataFrame:
+    """Lit un fichier déposé (objet fichier avec `.name`) et le normalise."""
+    with span("ingest.read_upload", bytes=getattr(up, "size", 0) or 0) as s:
+        df = _read_upload(up)
+        s["rows"] = len(df)
+    return df
+
+
+def _read_upload(up) -> pd.DataFrame:
+    name = up.name.lower()
+    if name.endswith(".csv"):
+        return _read_csv(up)
+    if name.endswith(".parquet"):
+        return _read_columnar(up, "parquet")
+    if name.endswith((".feather", ".arrow")):
+        return _read_columnar(up, "feather")
+    return read_xlsx(up.getvalue() if hasattr(up, "getvalue") else up.read())
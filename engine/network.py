@@ -0,0 +1,136 @@
+"""
+Réseau d'impacts (action → indicateur) : arêtes, mise en page et figure.
+
+La mise en page ne dépend que de la topologie (liste des arêtes) : elle peut
+être mise en cache et réutilisée quand seuls les poids changent (curseur
+d'intensité). Les arêtes sont dessinées en quelques traces groupées par
+classe d'épaisseur au lieu d'une trace par arête.
+"""
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .perf import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+WIDTH_BUCKETS = 6
+MIN_WIDTH, MAX_WIDTH = 1.0, 8.0
+# Au-delà, rendu WebGL et mise en page bipartite en mode automatique
+WEBGL_EDGES = 1000
+AUTO_SPRING_NODES = 300
+
+Edge = Tuple[str, str]
+
+
+def impact_edges(df_last: pd.DataFrame) -> pd.DataFrame:
+    """
+    Arêtes (action, indicateur, weight = |proj - valeur|) ; en cas de doublon
+    la dernière ligne l'emporte, comme des add_edge successifs.
+    """
+    out = pd.DataFrame({
+        "action": df_last["action"].astype(str).to_numpy(),
+        "indicateur": df_last["indicateur"].astype(str).to_numpy(),
+        "weight": (df_last["proj"].fillna(0) - df_last["valeur"].fillna(0)).abs().to_numpy(dtype=np.float64),
+    })
+    return out.drop_duplicates(["action", "indicateur"], keep="last").reset_index(drop=True)
+
+
+def topology(edges: pd.DataFrame) -> Tuple[Edge, ...]:
+    """Clé de cache de la mise en page : arêtes triées, sans poids."""
+    return tuple(sorted(zip(edges["action"], edges["indicateur"])))
+
+
+def _nodes(topo: Sequence[Edge]) -> Tuple[List[str], List[str]]:
+    actions = list(dict.fromkeys(a for a, _ in topo))
+    seen = set(actions)
+    indicators = [i for i in dict.fromkeys(i for _, i in topo) if i not in seen]
+    return actions, indicators
+
+
+def spring_layout(topo: Sequence[Edge], seed: int = 42) -> Dict[str, Tuple[float, float]]:
+    """Mise en page à ressorts (networkx), déterministe pour une topologie donnée."""
+    import networkx as nx
+
+    G = nx.DiGraph()
+    G.add_edges_from(topo)
+    return {n: (float(x), float(y)) for n, (x, y) in nx.spring_layout(G, seed=seed).items()}
+
+
+def bipartite_layout(topo: Sequence[Edge]) -> Dict[str, Tuple[float, float]]:
+    """
+    Actions à gauche, indicateurs à droite ; les indicateurs sont ordonnés
+    par barycentre de leurs actions pour limiter les croisements.
+    Linéaire en nombre d'arêtes.
+    """
+    actions, indicators = _nodes(topo)
+    a_pos = {a: i for i, a in enumerate(actions)}
+    i_pos = {n: i for i, n in enumerate(indicators)}
+    src = np.array([a_pos[a] for a, i in topo if i in i_pos], dtype=np.float64)
+    dst = np.array([i_pos[i] for a, i in topo if i in i_pos], dtype=np.int64)
+    sums = np.bincount(dst, weights=src, minlength=len(indicators))
+    counts = np.maximum(np.bincount(dst, minlength=len(indicators)), 1)
+    order = np.argsort(sums / counts, kind="stable")
+
+    def spread(n):
+        return np.linspace(1, -1, n) if n > 1 else np.zeros(n)
+
+    pos = {a: (-1.0, float(y)) for a, y in zip(actions, spread(len(actions)))}
+    pos.update({indicators[k]: (1.0, float(y)) for k, y in zip(order, spread(len(indicators)))})
+    return pos
+
+
+def compute_layout(topo: Sequence[Edge], method: str = "auto") -> Dict[str, Tuple[float, float]]:
+    """method : "spring", "bipartite" ou "auto" (spring pour les petits graphes)."""
+    if method == "auto":
+        actions, indicators = _nodes(topo)
+        method = "spring" if len(actions) + len(indicators) <= AUTO_SPRING_NODES else "bipartite"
+    with span(f"network.{method}_layout", rows=len(topo)):
+        return spring_layout(topo) if method == "spring" else bipartite_layout(topo)
+
+
+def network_figure(edges: pd.DataFrame, pos: Dict[str, Tuple[float, float]], height: int = 360) -> "go.Figure":
+    """Figure plotly : une trace par classe d'épaisseur + une trace de nœuds."""
+    import plotly.graph_objects as go
+
+    scatter = go.Scattergl if len(edges) > WEBGL_EDGES else go.Scatter
+    w = edges["weight"].to_numpy(dtype=np.float64)
+    wmax = w.max() if len(w) and w.max() > 0 else 1.0
+    bucket = np.minimum((w / wmax * WIDTH_BUCKETS).astype(np.int64), WIDTH_BUCKETS - 1)
+
+    xy = np.array([pos[n] for n in edges["action"]] + [pos[n] for n in edges["indicateur"]]).reshape(2, len(edges), 2)
+    traces = []
+    for b in np.unique(bucket):
+        sel = bucket == b
+        k = int(sel.sum())
+        # Segments séparés par des NaN : x0, x1, NaN, x0, x1, NaN...
+        xs = np.full((k, 3), np.nan)
+        ys = np.full((k, 3), np.nan)
+        xs[:, 0], xs[:, 1] = xy[0, sel, 0], xy[1, sel, 0]
+        ys[:, 0], ys[:, 1] = xy[0, sel, 1], xy[1, sel, 1]
+        width = MIN_WIDTH + (MAX_WIDTH - MIN_WIDTH) * b / (WIDTH_BUCKETS - 1)
+        traces.append(scatter(
+            x=xs.ravel(), y=ys.ravel(), mode="lines",
+            line=dict(width=width, color="#888"), hoverinfo="none", connectgaps=False,
+        ))
+
+    actions = set(edges["action"])
+    names = list(pos)
+    node_xy = np.array([pos[n] for n in names]) if names else np.zeros((0, 2))
+    traces.append(scatter(
+        x=node_xy[:, 0], y=node_xy[:, 1],
+        mode="markers+text",
+        text=names,
+        textposition="bottom center",
+        marker=dict(
+            size=28 if len(names) <= AUTO_SPRING_NODES else 8,
+            color=["lightgreen" if n in actions else "skyblue" for n in names],  # actions en vert, indicateurs en bleu
+            line=dict(width=2, color="#555"),
+        ),
+    ))
+
+    fig = go.Figure(data=traces)
+    fig.update_layout(height=height, showlegend=False, margin=dict(l=10, r=10, t=10, b=10))
+    return fig
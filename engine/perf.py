@@ -0,0 +1,207 @@
+"""
+Instrumentation légère des sections de l'app (temps, cache, volumes).
+
+`span("section", rows=..., bytes=...)` chronomètre un bloc ; les attributs
+peuvent être complétés dans le bloc (`s["rows"] = len(df)`). Une section
+appelée autour d'une fonction mise en cache est déclarée `cache="hit"` et
+la fonction appelle `miss()` quand son corps s'exécute réellement.
+
+Les mesures d'un rerun (`begin_run` / `end_run`) alimentent le panneau
+« Performance » et une ligne de log JSON (logger "perf", sur stderr ou dans
+PERF_LOG_FILE) ; des totaux par section sont exportés au format texte
+Prometheus si PERF_PROM_FILE est défini. Désactivé (PERF_METRICS absent), `span` renvoie un objet inerte
+partagé : aucune horloge, aucune allocation.
+"""
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+ENABLED = os.environ.get("PERF_METRICS", "").lower() in ("1", "true", "on", "yes")
+PROM_FILE = os.environ.get("PERF_PROM_FILE")
+LOG_FILE = os.environ.get("PERF_LOG_FILE")
+# Intervalle minimal entre deux écritures du fichier Prometheus
+PROM_INTERVAL = 10.0
+
+log = logging.getLogger("perf")
+
+
+def _configure_log():
+    """Niveau INFO + handler propre au logger "perf" (sinon ses lignes sont filtrées par la racine)."""
+    if log.handlers:  # module rechargé, ou handler posé par l'hôte
+        return
+    handler = logging.FileHandler(LOG_FILE, encoding="utf-8") if LOG_FILE else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+if ENABLED:
+    _configure_log()
+
+
+class _Null:
+    """Span inerte (instrumentation désactivée)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+
+_NULL = _Null()
+
+
+class Run:
+    """Mesures d'un rerun de script."""
+
+    def __init__(self, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started = time.time()
+        self.spans: List[Dict] = []
+
+
+# Propagés aux threads via contextvars.copy_context() (cf. pxweb.fetch_chunked)
+_run: contextvars.ContextVar = contextvars.ContextVar("perf_run", default=None)
+_stack: contextvars.ContextVar = contextvars.ContextVar("perf_stack", default=())
+
+# Totaux du processus : section -> compteurs
+_totals: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+_prom_written = 0.0
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "t0", "token")
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Dict:
+        self.token = _stack.set(_stack.get() + (self.attrs,))
+        self.t0 = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.t0
+        _stack.reset(self.token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _record(self.name, seconds, self.attrs)
+        return False
+
+
+def span(name: str, **attrs):
+    """Chronomètre un bloc `with` ; renvoie le dict d'attributs (ou un objet inerte)."""
+    if not ENABLED:
+        return _NULL
+    return _Span(name, attrs)
+
+
+def miss():
+    """Appelé dans le corps d'une fonction en cache : la section englobante devient un « miss »."""
+    if not ENABLED:
+        return
+    for attrs in reversed(_stack.get()):
+        if "cache" in attrs:
+            attrs["cache"] = "miss"
+            return
+
+
+def _record(name: str, seconds: float, attrs: Dict):
+    with _lock:
+        t = _totals.setdefault(name, {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "hit": 0, "miss": 0})
+        t["count"] += 1
+        t["seconds"] += seconds
+        t["rows"] += int(attrs.get("rows") or 0)
+        t["bytes"] += int(attrs.get("bytes") or 0)
+        if attrs.get("cache") in ("hit", "miss"):
+            t[attrs["cache"]] += 1
+    run = _run.get()
+    entry = {"section": name, "ms": round(seconds * 1000, 3), **attrs}
+    if run is not None:
+        run.spans.append(entry)
+    else:
+        # Hors rerun complet (fragment, callback, thread de fond) : ligne de log isolée
+        log.info(json.dumps({"event": "span", **entry}, ensure_ascii=False, default=str))
+
+
+def begin_run(label: str = "") -> Optional[Run]:
+    if not ENABLED:
+        return None
+    run = Run(label)
+    _run.set(run)
+    return run
+
+
+def end_run(run: Optional[Run]) -> List[Dict]:
+    """Clôt le rerun : log JSON, export Prometheus (limité), retourne les spans."""
+    if run is None:
+        return []
+    _run.set(None)
+    total = round((time.time() - run.started) * 1000, 3)
+    log.info(json.dumps({"event": "run", "run": run.id, "label": run.label, "ms": total,
+                         "spans": run.spans}, ensure_ascii=False, default=str))
+    if PROM_FILE:
+        global _prom_written
+        now = time.time()
+        if now - _prom_written >= PROM_INTERVAL:
+            _prom_written = now
+            write_prometheus(PROM_FILE)
+    return run.spans
+
+
+def totals() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        return {k: dict(v) for k, v in _totals.items()}
+
+
+def prometheus_text() -> str:
+    """Totaux par section au format d'exposition texte Prometheus."""
+    lines = [
+        "# HELP app_section_seconds Temps passé par section de l'app.",
+        "# TYPE app_section_seconds summary",
+    ]
+    data = totals()
+    for name, t in sorted(data.items()):
+        lines.append(f'app_section_seconds_sum{{section="{name}"}} {t["seconds"]:.6f}')
+        lines.append(f'app_section_seconds_count{{section="{name}"}} {t["count"]}')
+    for metric, help_, keys in (
+        ("app_section_cache_total", "Accès aux caches par section et résultat.", ("hit", "miss")),
+        ("app_section_rows_total", "Lignes traitées par section.", ("rows",)),
+        ("app_section_bytes_total", "Octets produits ou lus par section.", ("bytes",)),
+    ):
+        lines += [f"# HELP {metric} {help_}", f"# TYPE {metric} counter"]
+        for name, t in sorted(data.items()):
+            for k in keys:
+                if metric == "app_section_cache_total":
+                    lines.append(f'{metric}{{section="{name}",result="{k}"}} {t[k]}')
+                else:
+                    lines.append(f'{metric}{{section="{name}"}} {t[k]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    """Écriture atomique (lue par node_exporter --collector.textfile)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
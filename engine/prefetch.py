@@ -0,0 +1,122 @@
+"""
+Préchargement des tables PxWeb configurées.
+
+Un thread de fond rafraîchit périodiquement une liste de couples (URL,
+requête) dans le cache disque (cf. pxcache.py) : au démarrage, puis toutes
+les `interval` secondes (± jitter). Une entrée n'est retéléchargée que si
+elle approche de son TTL, ce qui évite les doublons quand plusieurs
+processus partagent le même cache. Les téléchargements passent par un pool
+borné : l'interface ne fait plus qu'une lecture du cache.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .pxcache import PxCache, cache_key
+from .sources import default_pxweb_example
+
+PREFETCH_INTERVAL = 3600.0
+# Fraction aléatoire de l'intervalle (±) : désynchronise les processus
+JITTER = 0.1
+MAX_WORKERS = 2
+# Retélécharge une entrée dès qu'elle a atteint cette fraction de son TTL
+REFRESH_AT = 0.8
+
+Target = Tuple[str, Dict]
+
+
+def load_targets(path: str) -> List[Target]:
+    """Lit un fichier JSON `[{"url": ..., "query": {...}}, ...]`."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [(item["url"], item["query"]) for item in items]
+
+
+def targets_from_env() -> List[Target]:
+    """
+    Tables à précharger selon PXWEB_PREFETCH : chemin d'un fichier JSON de
+    tables, "off" pour aucune ; par défaut la table d'exemple.
+    """
+    conf = os.environ.get("PXWEB_PREFETCH", "default")
+    if conf.lower() in ("", "0", "off"):
+        return []
+    if conf == "default":
+        return [default_pxweb_example()]
+    return load_targets(conf)
+
+
+def interval_from_env() -> float:
+    return float(os.environ.get("PXWEB_PREFETCH_INTERVAL", PREFETCH_INTERVAL))
+
+
+class Prefetcher:
+    """Rafraîchit `targets` dans `cache` en arrière-plan, au plus `workers` à la fois."""
+
+    def __init__(self, cache: PxCache, fetch: Callable[[str, Dict], pd.DataFrame],
+                 targets: List[Target], interval: float = PREFETCH_INTERVAL,
+                 jitter: float = JITTER, workers: int = MAX_WORKERS):
+        self.cache = cache
+        self.fetch = fetch
+        self.targets = list(targets)
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self._status: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _warm(self, url: str, query: Dict):
+        key = cache_key(url, query)
+        fetched_at = self.cache.fetched_at(key)
+        if fetched_at is None or time.time() - fetched_at >= REFRESH_AT * self.cache.ttl:
+            if fetched_at is not None:
+                # Rafraîchissement : petit délai aléatoire pour étaler les requêtes d'un cycle
+                self._stop.wait(random.uniform(0, self.jitter * min(self.interval, 60)))
+            try:
+                self.cache.put(key, self.fetch(url, query), url, query)
+            except Exception as e:
+                with self._lock:
+                    self._status[key] = {"url": url, "error": str(e), "at": time.time()}
+                return
+        with self._lock:
+            self._status[key] = {"url": url, "error": None, "at": time.time()}
+
+    def run_once(self):
+        """Un cycle de préchargement de toutes les tables (bloquant)."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for f in [pool.submit(self._warm, url, q) for url, q in self.targets]:
+                f.result()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def start(self) -> "Prefetcher":
+        if self._thread is None and self.targets:
+            self._thread = threading.Thread(target=self._loop, name="pxweb-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict[str, Dict]:
+        """Dernier passage par clé de cache : {"url", "error", "at"}."""
+        with self._lock:
+            return dict(self._status)
+
+
+def format_age(seconds: float) -> str:
+    """Âge lisible : « 42 s », « 12 min », « 3 h », « 2 j »."""
+    for unit, size in (("j", 86400), ("h", 3600), ("min", 60)):
+        if seconds >= size:
+            return f"{seconds / size:.0f} {unit}"
+    return f"{seconds:.0f} s"
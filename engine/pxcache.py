@@ -0,0 +1,158 @@
+"""
+Cache disque persistant des réponses PxWeb décodées.
+
+Partagé entre processus et redémarrages : une entrée = un fichier Parquet
+(`<clé>.parquet`) + un fichier de métadonnées (`<clé>.json`). La clé est un
+hash de l'URL et du JSON de requête canonique. Les écritures sont atomiques
+(fichier temporaire + os.replace), l'éviction est LRU sur la date du dernier
+accès (mtime du fichier de métadonnées) sous un plafond de taille.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+
+def cache_key(url: str, query: Dict) -> str:
+    """Hash stable de (URL, requête JSON canonique)."""
+    canon = json.dumps(query, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{url}\n{canon}".encode("utf-8")).hexdigest()
+
+
+class PxCache:
+    """
+    Cache disque (Parquet) avec TTL, plafond de taille (éviction LRU) et
+    stale-while-revalidate : une entrée expirée depuis moins de `stale_ttl`
+    secondes est servie immédiatement pendant qu'un thread la rafraîchit.
+    """
+
+    def __init__(self, root, ttl: float = 6 * 3600, max_bytes: int = 512 * 2**20,
+                 stale_ttl: float = 7 * 24 * 3600):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    # ---- fichiers ----
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.root / f"{key}.parquet", self.root / f"{key}.json"
+
+    def _atomic_write(self, path: Path, write: Callable[[str], None]):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # ---- API ----
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, float]]:
+        """Retourne (frame, âge en secondes) ou None si absent/illisible."""
+        data, meta = self._paths(key)
+        try:
+            fetched_at = json.loads(meta.read_text("utf-8"))["fetched_at"]
+            df = pd.read_parquet(data)
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(meta)  # dernier accès -> LRU
+        except OSError:
+            pass
+        return df, time.time() - fetched_at
+
+    def fetched_at(self, key: str) -> Optional[float]:
+        """Horodatage du téléchargement de l'entrée (métadonnées seules), None si absente."""
+        try:
+            return float(json.loads(self._paths(key)[1].read_text("utf-8"))["fetched_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, df: pd.DataFrame, url: str = "", query: Optional[Dict] = None):
+        data, meta = self._paths(key)
+        self._atomic_write(data, lambda tmp: df.to_parquet(tmp, index=False))
+        payload = json.dumps({"url": url, "query": query, "fetched_at": time.time(),
+                              "rows": int(len(df))}, ensure_ascii=False)
+        self._atomic_write(meta, lambda tmp: Path(tmp).write_text(payload, "utf-8"))
+        self.evict()
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes."""
+        entries = []
+        total = 0
+        for meta in self.root.glob("*.json"):
+            data = meta.with_suffix(".parquet")
+            try:
+                size = data.stat().st_size + meta.stat().st_size
+                used = meta.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((used, size, data, meta))
+            total += size
+        for used, size, data, meta in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for p in (meta, data):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+    def _refresh(self, key, url, query, fetch):
+        try:
+            self.put(key, fetch(url, query), url, query)
+        except Exception:
+            pass  # on garde l'entrée périmée, nouvel essai au prochain accès
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def fetch(self, url: str, query: Dict,
+              fetch: Callable[[str, Dict], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Lit (url, query) depuis le disque ; appelle `fetch` en cas d'absence
+        ou d'expiration. Entre ttl et ttl + stale_ttl, sert la version
+        périmée et relance `fetch` en arrière-plan.
+        """
+        key = cache_key(url, query)
+        hit = self.get(key)
+        if hit is not None:
+            df, age = hit
+            if age <= self.ttl:
+                return df
+            if age <= self.ttl + self.stale_ttl:
+                with self._lock:
+                    start = key not in self._inflight
+                    self._inflight.add(key)
+                if start:
+                    threading.Thread(target=self._refresh, args=(key, url, query, fetch),
+                                     daemon=True).start()
+                return df
+        df = fetch(url, query)
+        self.put(key, df, url, query)
+        return df
+
+
+def cache_from_env() -> PxCache:
+    """
+    Cache configuré par les variables d'environnement partagées par l'app et
+    la ligne de commande : PXWEB_CACHE_DIR, PXWEB_CACHE_TTL (s),
+    PXWEB_CACHE_MAX_MB, PXWEB_CACHE_STALE (s).
+    """
+    return PxCache(
+        os.environ.get("PXWEB_CACHE_DIR", ".cache/pxweb"),
+        ttl=float(os.environ.get("PXWEB_CACHE_TTL", 6 * 3600)),
+        max_bytes=int(float(os.environ.get("PXWEB_CACHE_MAX_MB", 512)) * 2**20),
+        stale_ttl=float(os.environ.get("PXWEB_CACHE_STALE", 7 * 24 * 3600)),
+    )
@@ -0,0 +1,412 @@
+"""
+Outils PxWeb (Helsinki) indépendants de Streamlit.
+
+Le décodage json-stat est vectorisé : les colonnes de dimensions sont
+construites directement à partir des tableaux de catégories (codes
+catégoriels répétés / tuilés), sans produit cartésien ni dict par cellule.
+
+Les requêtes trop grosses pour la limite de cellules du serveur sont
+découpées le long de leur plus grande dimension (souvent `Vuosi`) et
+envoyées en parallèle via une session HTTP partagée (pool de connexions).
+"""
+import contextvars
+import copy
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .perf import span
+
+if TYPE_CHECKING:
+    import requests
+
+# Limites par défaut de stat.hel.fi (voir guide API PxWeb Helsinki),
+# remplacées par celles annoncées par le serveur (`?config`) quand disponibles
+MAX_CELLS = 100_000
+MAX_CALLS = 30
+TIME_WINDOW = 10.0
+MAX_WORKERS = 4
+
+
+def _dimension_categories(dim: Dict) -> Tuple[List[str], Dict[str, str]]:
+    """Retourne (codes dans l'ordre d'index, labels) pour une dimension json-stat."""
+    category = dim.get("category", {})
+    labels = category.get("label", {}) or {}
+    index = category.get("index")
+    if index is None:
+        # json-stat autorise une catégorie unique décrite seulement par son label
+        codes = list(labels.keys())
+    elif isinstance(index, list):
+        codes = list(index)
+    else:
+        codes = sorted(index, key=lambda k: index[k])
+    return codes, labels
+
+
+def _dense_array(obj, n: int, dtype, fill) -> np.ndarray:
+    """
+    Convertit un champ json-stat `value`/`status` (liste, dict creux ou scalaire)
+    en tableau dense de longueur n.
+    """
+    if isinstance(obj, dict):
+        out = np.full(n, fill, dtype=dtype)
+        if obj:
+            idx = np.fromiter((int(k) for k in obj.keys()), dtype=np.int64, count=len(obj))
+            out[idx] = list(obj.values())
+        return out
+    if obj is None or isinstance(obj, (str, int, float)):
+        return np.full(n, fill if obj is None else obj, dtype=dtype)
+    arr = np.full(n, fill, dtype=dtype)
+    m = min(n, len(obj))
+    arr[:m] = obj[:m]
+    return arr
+
+
+def _values_array(values, n: int) -> np.ndarray:
+    """Valeurs json-stat -> float64, cellules nulles / non numériques -> NaN."""
+    try:
+        return _dense_array(values, n, np.float64, np.nan)
+    except (TypeError, ValueError):
+        # Symboles PxWeb du type ".." ou "-" : on passe par to_numeric
+        raw = _dense_array(values, n, object, None)
+        return pd.to_numeric(pd.Series(raw), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def decode_jsonstat(j: Dict) -> pd.DataFrame:
+    """
+    Transforme une réponse json-stat PxWeb en DataFrame long (tidy) :
+    une colonne catégorielle par dimension (labels) + 'value',
+    et 'status' si la réponse en contient.
+    """
+    if "dataset" in j:  # json-stat 1 (format "json-stat" de PxWeb v1)
+        j = j["dataset"]
+    dims = j.get("dimension", {})
+    dim_order = j.get("id") or dims.get("id", [])
+    categories = []
+    for dim_id in dim_order:
+        codes, labels = _dimension_categories(dims[dim_id])
+        categories.append((dim_id, codes, labels))
+
+    sizes = [len(codes) for (_, codes, _) in categories]
+    n = int(np.prod(sizes, dtype=np.int64)) if sizes else 0
+
+    data = {}
+    inner = n
+    for (dim_id, codes, labels), size in zip(categories, sizes):
+        # Ordre "row-major" json-stat : la dernière dimension varie le plus vite
+        inner //= size if size else 1
+        outer = n // (inner * size) if size else 0
+        shown = pd.Index([labels.get(c, c) for c in codes])
+        # Deux codes peuvent partager le même label : on dédoublonne les catégories
+        cats, remap = pd.unique(shown), None
+        if len(cats) != len(shown):
+            remap = pd.Index(cats).get_indexer(shown)
+        pos = np.tile(np.repeat(np.arange(size, dtype=np.int32), inner), outer)
+        if remap is not None:
+            pos = remap[pos]
+        data[dim_id] = pd.Categorical.from_codes(pos, categories=cats)
+
+    data["value"] = _values_array(j.get("value", []), n)
+    if "status" in j:
+        status = _dense_array(j["status"], n, object, None)
+        data["status"] = pd.Categorical(status)
+    return pd.DataFrame(data)
+
+
+# ---------------------------
+# ------ HTTP / CHUNKS ------
+# ---------------------------
+_SESSION: Optional["requests.Session"] = None
+
+
+def _requests():
+    """`requests`, importé au premier appel réseau seulement (démarrage à froid)."""
+    import requests
+
+    return requests
+
+
+def session() -> "requests.Session":
+    """Session HTTP partagée (keep-alive, pool dimensionné pour les threads)."""
+    global _SESSION
+    if _SESSION is None:
+        from requests.adapters import HTTPAdapter
+
+        s = _requests().Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_WORKERS * 2)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _SESSION = s
+    return _SESSION
+
+
+class _RateLimiter:
+    """Fenêtre glissante : au plus `calls` requêtes par `window` secondes."""
+
+    def __init__(self, calls: int, window: float):
+        self.calls, self.window = calls, window
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= self.window:
+                    self._sent.popleft()
+                if len(self._sent) < self.calls:
+                    self._sent.append(now)
+                    return
+                delay = self.window - (now - self._sent[0])
+            time.sleep(delay)
+
+
+def _api_root(url: str) -> str:
+    marker = "/api/v1/"
+    return url[:url.index(marker) + len(marker)] if marker in url else url.rsplit("/", 1)[0] + "/"
+
+
+@lru_cache(maxsize=16)
+def fetch_config(url: str) -> Dict:
+    """Limites du serveur PxWeb (maxValues, maxCalls, timeWindow) ; {} si indisponible."""
+    try:
+        return session().get(_api_root(url) + "?config", timeout=10).json()
+    except (_requests().RequestException, ValueError):
+        return {}
+
+
+_LIMITERS: Dict[str, _RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _limiter(url: str) -> _RateLimiter:
+    root = _api_root(url)
+    with _LIMITERS_LOCK:
+        if root not in _LIMITERS:
+            cfg = fetch_config(url)
+            _LIMITERS[root] = _RateLimiter(int(cfg.get("maxCalls", MAX_CALLS)),
+                                           float(cfg.get("timeWindow", TIME_WINDOW)))
+        return _LIMITERS[root]
+
+
+def _request(method: str, url: str, retries: int = 5, timeout: float = 30, **kwargs) -> "requests.Response":
+    """
+    Requête avec nouvelle tentative : 429/503 (limite de débit PxWeb) et
+    erreurs réseau -> attente `Retry-After` ou backoff exponentiel + jitter.
+    """
+    requests = _requests()
+    limiter = _limiter(url)
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            r = session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if r.status_code not in (429, 502, 503, 504) or attempt == retries:
+                r.raise_for_status()
+                return r
+            retry_after = r.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                time.sleep(float(retry_after))
+                continue
+        time.sleep(min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+    raise RuntimeError("unreachable")
+
+
+@lru_cache(maxsize=64)
+def fetch_metadata(url: str) -> Dict:
+    """Métadonnées d'une table PxWeb (GET) : variables, valeurs, élimination."""
+    return _request("GET", url).json()
+
+
+def _selected_values(selection: Dict, values: List[str]) -> Optional[List[str]]:
+    """Valeurs retenues par un filtre PxWeb, ou None si non résoluble (agg:, vs:...)."""
+    flt = selection.get("filter", "item")
+    wanted = selection.get("values", [])
+    if flt == "item":
+        return list(wanted)
+    if flt == "all":
+        if wanted in (["*"], []):
+            return list(values)
+        prefixes = [w.rstrip("*") for w in wanted]
+        return [v for v in values if any(v.startswith(p) for p in prefixes)]
+    if flt == "top":
+        return list(values)[-int(wanted[0]):] if wanted else list(values)
+    return None
+
+
+def split_query(query: Dict, meta: Dict, max_cells: int = MAX_CELLS) -> List[Dict]:
+    """
+    Découpe une requête PxWeb en sous-requêtes de moins de `max_cells`
+    cellules, le long de la plus grande dimension (récursivement si une
+    seule valeur de celle-ci dépasse encore la limite).
+    """
+    selections = {q["code"]: q for q in query.get("query", [])}
+    sizes, explicit = {}, {}
+    for var in meta.get("variables", []):
+        code, values = var["code"], var.get("values", [])
+        if code in selections:
+            chosen = _selected_values(selections[code]["selection"], values)
+            sizes[code] = len(chosen) if chosen is not None else 1
+            if chosen is not None:
+                explicit[code] = chosen
+        elif var.get("elimination"):
+            sizes[code] = 1
+        else:
+            sizes[code] = len(values)
+            explicit[code] = list(values)
+
+    cells = int(np.prod(list(sizes.values()), dtype=np.int64)) if sizes else 0
+    splittable = [c for c in explicit if len(explicit[c]) > 1]
+    if cells <= max_cells or not splittable:
+        return [query]
+
+    dim = max(splittable, key=lambda c: len(explicit[c]))
+    per_value = cells // len(explicit[dim])
+    step = max(1, max_cells // max(per_value, 1))
+    out = []
+    values = explicit[dim]
+    for i in range(0, len(values), step):
+        sub = copy.deepcopy(query)
+        entry = {"code": dim, "selection": {"filter": "item", "values": values[i:i + step]}}
+        sub["query"] = [q for q in sub.get("query", []) if q["code"] != dim] + [entry]
+        out.extend(split_query(sub, meta, max_cells) if per_value > max_cells else [sub])
+    return out
+
+
+def merge_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatène des frames décodés en conservant les colonnes catégorielles."""
+    if len(frames) == 1:
+        return frames[0]
+    out = pd.concat(frames, ignore_index=True)
+    # Colonnes catégorielles de n'importe quel morceau : 'status' n'est présent que dans les
+    # réponses où une cellule porte un symbole, les morceaux sans la colonne sont complétés par NA
+    categorical = {c for f in frames for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)}
+    for col in out.columns:
+        if col not in categorical:
+            continue
+        present = [f[col].astype("category") for f in frames if col in f]
+        empty = present[0].cat.categories[:0]  # même type de catégories que les morceaux présents
+        parts = [f[col].astype("category") if col in f
+                 else pd.Categorical.from_codes(np.full(len(f), -1), categories=empty)
+                 for f in frames]
+        out[col] = pd.api.types.union_categoricals(parts, ignore_order=True)
+    return out
+
+
+def fetch_jsonstat(url: str, query: Dict, timeout: float = 30) -> pd.DataFrame:
+    """POST JSON vers une table PxWeb et décode la réponse json-stat."""
+    with span("pxweb.post") as s:
+        r = _request("POST", url, json=query, timeout=timeout)
+        s["bytes"] = len(r.content)
+        j = r.json()
+    with span("pxweb.decode") as s:
+        df = decode_jsonstat(j)
+        s["rows"] = len(df)
+    return df
+
+
+def fetch_chunked(url: str, query: Dict, max_cells: Optional[int] = None,
+                  workers: int = MAX_WORKERS) -> pd.DataFrame:
+    """
+    Comme fetch_jsonstat, mais lit d'abord les métadonnées de la table et
+    découpe la requête sous la limite de cellules (celle du serveur par
+    défaut) ; les morceaux sont interrogés en parallèle (pool de `workers`
+    threads, débit limité selon `maxCalls`/`timeWindow`) puis fusionnés.
+    """
+    if max_cells is None:
+        max_cells = int(fetch_config(url).get("maxValues", MAX_CELLS))
+    try:
+        meta = fetch_metadata(url)
+    except (_requests().RequestException, ValueError):
+        return fetch_jsonstat(url, query)
+    chunks = split_query(query, meta, max_cells)
+    if len(chunks) == 1:
+        return fetch_jsonstat(url, chunks[0])
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        # Contexte copié par morceau : les mesures (perf.span) restent rattachées au rerun
+        futures = [pool.submit(contextvars.copy_context().run, fetch_jsonstat, url, q) for q in chunks]
+        frames = [f.result() for f in futures]
+    return merge_frames(frames)
+
+
+# ---------------------------
+# --- RAFRAÎCHISSEMENT DELTA -
+# ---------------------------
+def _time_variable(meta: Dict) -> Optional[Dict]:
+    """Variable temporelle de la table (drapeau `time`, sinon Vuosi/Vuodet)."""
+    variables = meta.get("variables", [])
+    for var in variables:
+        if var.get("time"):
+            return var
+    for var in variables:
+        if var["code"].lower() in ("vuosi", "vuodet"):
+            return var
+    return None
+
+
+def fetch_incremental(url: str, query: Dict, store) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Rafraîchit une table par année : relit le frame long déjà stocké dans
+    `store` (un PxCache), n'interroge PxWeb que pour les années manquantes
+    + la plus récente (révisions), puis fusionne et réenregistre.
+
+    Retourne (frame, {"fetched": cellules téléchargées, "reused": cellules réutilisées}).
+    """
+    from .pxcache import cache_key
+
+    try:
+        meta = fetch_metadata(url)
+    except (_requests().RequestException, ValueError):
+        meta = {}
+    tvar = _time_variable(meta)
+    if tvar is None:
+        df = fetch_chunked(url, query)
+        return df, {"fetched": len(df), "reused": 0}
+
+    code, values = tvar["code"], tvar.get("values", [])
+    labels = dict(zip(values, tvar.get("valueTexts", values)))
+    selection = next((q["selection"] for q in query.get("query", []) if q["code"] == code), None)
+    wanted = _selected_values(selection, values) if selection else list(values)
+    if not wanted:
+        df = fetch_chunked(url, query)
+        return df, {"fetched": len(df), "reused": 0}
+
+    # Clé indépendante de la sélection d'années : toutes les plages partagent l'historique
+    base = copy.deepcopy(query)
+    base["query"] = [q for q in base.get("query", []) if q["code"] != code]
+    key = cache_key(url, base) + "-delta"
+    hit = store.get(key)
+    previous = hit[0] if hit is not None else None
+
+    have = set()
+    if previous is not None and code in previous.columns:
+        have = set(previous[code].astype(str).unique())
+    position = {v: i for i, v in enumerate(values)}
+    latest = max(wanted, key=lambda v: position.get(v, -1))
+    missing = [v for v in wanted if labels.get(v, v) not in have or v == latest]
+
+    delta_query = copy.deepcopy(base)
+    delta_query["query"].append({"code": code, "selection": {"filter": "item", "values": missing}})
+    delta = fetch_chunked(url, delta_query)
+
+    refreshed = {labels.get(v, v) for v in missing}
+    kept = None
+    if previous is not None and code in previous.columns:
+        kept = previous[~previous[code].astype(str).isin(refreshed)]
+    merged = merge_frames([kept, delta]) if kept is not None and len(kept) else delta
+    store.put(key, merged, url, base)
+
+    wanted_labels = {labels.get(v, v) for v in wanted}
+    out = merged[merged[code].astype(str).isin(wanted_labels)].reset_index(drop=True)
+    reused = int(kept[code].astype(str).isin(wanted_labels).sum()) if kept is not None else 0
+    return out, {"fetched": len(delta), "reused": reused}
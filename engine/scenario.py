@@ -0,0 +1,99 @@
+"""
+Projection de scénarios sur plusieurs années, par action.
+
+Chaque série (indicateur, action) part de sa dernière valeur observée et
+rejoint `intensité × valeur` à l'horizon (croissance géométrique). Des
+trajectoires Monte Carlo ajoutent un bruit log-normal dont la volatilité
+est estimée sur l'historique de la série ; on en garde les percentiles.
+Tout est calculé en tableaux NumPy, par lots de séries pour borner la mémoire.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (5, 50, 95)
+DEFAULT_SIGMA = 0.05
+# Nombre maximal d'éléments (trajectoires × séries × années) par lot
+BATCH_ELEMS = 20_000_000
+
+
+def last_observed(view: pd.Series) -> pd.DataFrame:
+    """Dernière année et dernière valeur de chaque série (indicateur, action) du cube."""
+    last = view.groupby(level=["indicateur", "action"], observed=True).tail(1)
+    return pd.DataFrame({
+        "annee": last.index.get_level_values("annee").to_numpy(),
+        "valeur": last.to_numpy(dtype=np.float64),
+    }, index=last.index.droplevel("annee"))
+
+
+def estimate_volatility(view: pd.Series, default: float = DEFAULT_SIGMA,
+                        floor: float = 0.01, cap: float = 0.5) -> pd.Series:
+    """Écart-type des log-variations annuelles par série, borné ; `default` si historique insuffisant."""
+    logv = np.log(view.where(view > 0))
+    returns = logv.groupby(level=["indicateur", "action"], observed=True).diff()
+    sigma = returns.groupby(level=["indicateur", "action"], observed=True).std()
+    return sigma.fillna(default).clip(floor, cap)
+
+
+def simulate(base: np.ndarray, growth: np.ndarray, sigma: np.ndarray, horizon: int,
+             n_sims: int = 1000, quantiles: Sequence[float] = QUANTILES,
+             seed: Optional[int] = 42) -> np.ndarray:
+    """
+    Percentiles des trajectoires simulées, tableau (quantiles, séries, horizon).
+
+    `growth` est la croissance log annuelle, `sigma` la volatilité log
+    annuelle de chaque série ; le drift est corrigé (-σ²/2) pour que la
+    médiane suive la trajectoire déterministe.
+    """
+    n = len(base)
+    rng = np.random.default_rng(seed)
+    out = np.empty((len(quantiles), n, horizon))
+    chunk = max(1, int(BATCH_ELEMS // max(1, n_sims * horizon)))
+    for lo in range(0, n, chunk):
+        hi = min(n, lo + chunk)
+        s = sigma[lo:hi, None].astype(np.float32)
+        drift = (growth[lo:hi, None] - 0.5 * s ** 2).astype(np.float32)[None]
+        # Un seul tableau float32 par lot (≈ 4 × BATCH_ELEMS octets) : cumul, exp et
+        # base appliqués sur place, percentiles calculés en réordonnant ce tableau
+        paths = rng.standard_normal((n_sims, hi - lo, horizon), dtype=np.float32)
+        paths *= s[None]
+        paths += drift
+        np.cumsum(paths, axis=2, out=paths)
+        np.exp(paths, out=paths)
+        paths *= base[lo:hi, None].astype(np.float32)[None]
+        out[:, lo:hi] = np.percentile(paths, quantiles, axis=0, overwrite_input=True)
+    return out
+
+
+def project(view: pd.Series, intensities: Dict[str, float], default_pct: float = 100,
+            horizon: int = 5, n_sims: int = 1000, quantiles: Sequence[float] = QUANTILES,
+            seed: Optional[int] = 42) -> pd.DataFrame:
+    """
+    Bandes de projection de toutes les séries du cube filtré.
+
+    `intensities` : action -> intensité en % atteinte à l'horizon (sinon
+    `default_pct`). Retourne un tableau long (indicateur, action, annee,
+    p<q>...) sur les `horizon` années suivant la dernière observation.
+    """
+    last = last_observed(view)
+    if last.empty:
+        return pd.DataFrame(columns=["indicateur", "action", "annee"] + [f"p{q:g}" for q in quantiles])
+    actions = last.index.get_level_values("action")
+    pct = pd.Series(actions.astype(str), index=last.index).map(intensities).fillna(default_pct)
+    mult = np.maximum(pct.to_numpy(dtype=np.float64) / 100.0, 1e-6)
+    sigma = estimate_volatility(view).reindex(last.index).fillna(DEFAULT_SIGMA).to_numpy()
+
+    bands = simulate(last["valeur"].to_numpy(), np.log(mult) / horizon, sigma, horizon,
+                     n_sims=n_sims, quantiles=quantiles, seed=seed)
+
+    n = len(last)
+    steps = np.arange(1, horizon + 1)
+    out = pd.DataFrame({
+        "indicateur": np.repeat(last.index.get_level_values("indicateur").to_numpy(), horizon),
+        "action": np.repeat(actions.to_numpy(), horizon),
+        "annee": (last["annee"].to_numpy()[:, None] + steps[None]).ravel(),
+    })
+    for k, q in enumerate(quantiles):
+        out[f"p{q:g}"] = bands[k].reshape(n * horizon)
+    return out
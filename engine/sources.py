@@ -0,0 +1,101 @@
+"""
+Sources de données intégrées : jeu fictif de démonstration, table PxWeb
+d'exemple et normalisation des réponses PxWeb vers le schéma long
+(source, action, indicateur, annee, valeur). Sans dépendance à Streamlit :
+partagé par l'app et la ligne de commande (cf. cli.py).
+"""
+import pandas as pd
+
+from .ingest import compact_long
+
+
+def load_fictive_data():
+    # Série temporelle 2020–2025 pour 3 actions et leurs indicateurs.
+    years = list(range(2019, 2025))
+    actions_time = {
+        "Plantation d'arbres": {
+            "Émissions CO₂ (t/an)": [1000, 980, 960, 940, 920, 900],
+            "Surface verte (m²)": [5000, 5100, 5200, 5300, 5400, 5500],
+        },
+        "Lampadaires LED": {
+            "Consommation énergie (kWh/an)": [20000, 18000, 16000, 14000, 13000, 12000],
+            "Émissions CO₂ (t/an)": [800, 720, 640, 560, 520, 480],
+        },
+        "Compostage": {
+            "Déchets en décharge (t/an)": [500, 480, 460, 440, 420, 400],
+            "Économies (€/an)": [0, 1000, 2000, 3000, 4000, 5000],
+        }
+    }
+    rows = []
+    for action, inds in actions_time.items():
+        for ind, vals in inds.items():
+            for y, v in zip(years, vals):
+                rows.append({"source": "Fictif", "action": action, "indicateur": ind, "annee": y, "valeur": v})
+    return pd.DataFrame(rows), years, list(actions_time.keys())
+
+
+def default_pxweb_example():
+    """
+    Exemple prêt-à-copier depuis la doc PxWeb Helsinki.
+    ⚠️ A ADAPTER à ta table environnementale (voir API helper sur stat.hel.fi).
+
+    Ici on montre la structure (Alue/Vuosi). Remplace l'URL et les codes variables
+    par ceux de ta table (ex. indicateurs de durabilité / climat).
+    """
+    url = "https://stat.hel.fi:443/api/v1/fi/Ymparistotilasto/ene/kauen/ymp_kauen_002f.px"
+    example_query = {
+  "query": [
+    {
+      "code": "Tiedot",
+      "selection": {
+        "filter": "item",
+        "values": [
+          "määkpl"
+        ]
+      }
+    }
+  ],
+  "response": {
+    "format": "json-stat"
+  }
+}
+    return url, example_query
+
+
+def pxweb_to_long(df_px: pd.DataFrame) -> pd.DataFrame:
+    """Normalise un frame PxWeb décodé vers le schéma long de l'app."""
+    # Heuristique de normalisation : cherche colonnes temps/aire/indicateur
+    # On renomme les colonnes les plus probables (Vuosi=année)
+    rename_map = {}
+    for c in df_px.columns:
+        lc = c.lower()
+        if "vuosi" in lc or "vuodet" in lc or "vuosi (year)" in lc:
+            rename_map[c] = "annee"
+        if "alue" in lc:  # zone
+            rename_map[c] = "action"  # on le pose comme 'action' par défaut
+        if "value" == lc:
+            rename_map[c] = "valeur"
+    df_px = df_px.rename(columns=rename_map)
+    # Ajoute indicateur si manquant
+    if "indicateur" not in df_px.columns:
+        df_px["indicateur"] = "Indicateur PxWeb"
+    # Ajoute année si manquante
+    if "annee" not in df_px.columns and "Vuosi" in df_px.columns:
+        df_px = df_px.rename(columns={"Vuosi": "annee"})
+    # Par sécurité, essaie de caster année
+    if "annee" in df_px.columns:
+        df_px["annee"] = pd.to_numeric(df_px["annee"], errors="coerce")
+    df_px["source"] = "Réel (PxWeb)"
+    # Construit df_long
+    if not {"action","indicateur","annee","valeur"}.issubset(df_px.columns):
+        # On tente une version minimale
+        candidate_cols = [c for c in df_px.columns if c not in ("valeur","value")]
+        if candidate_cols:
+            df_px["action"] = df_px[candidate_cols[0]].astype(str)
+        if "valeur" not in df_px.columns and "value" in df_px.columns:
+            df_px["valeur"] = df_px["value"]
+        if "annee" not in df_px.columns:
+            df_px["annee"] = pd.NA
+        if "indicateur" not in df_px.columns:
+            df_px["indicateur"] = "Indicateur PxWeb"
+    return compact_long(df_px[["source","action","indicateur","annee","valeur"]].dropna(subset=["valeur"]))
@@ -0,0 +1,124 @@
+"""
+Tendances de toutes les séries (indicateur, action) du cube filtré.
+
+Une seule passe groupée en NumPy (bincount / reduceat sur les séries
+contiguës du cube trié), sans boucle Python par série : pente des moindres
+carrés, TCAC, volatilité des log-variations et repérage d'une année
+anormale (résidu extrême autour de la droite de tendance).
+"""
+import numpy as np
+import pandas as pd
+
+SERIES_LEVELS = ["indicateur", "action"]
+# Seuil du z-score modifié (0.6745 × |résidu - médiane| / MAD) au-delà duquel une année est
+# anormale : ANOMALY_Z + ANOMALY_Z_SMALL / n. Sur peu de points, la MAD des résidus est très
+# bruitée et le maximum des z dépasse souvent 3.5 sans anomalie (≈ 11 % des séries de 10 ans
+# sans saut de benchmarks/synthetic.py) ; ce seuil ramène les faux positifs à ≈ 1–1.5 % des
+# séries sans anomalie, de 6 à 30 ans (bruit gaussien comme synthétique), et garde la
+# plupart des sauts ×3 / ×0.3.
+ANOMALY_Z = 3.5
+ANOMALY_Z_SMALL = 30.0
+# Nombre minimal d'années pour juger une anomalie (en deçà, ni la droite ni la MAD ne sont fiables)
+ANOMALY_MIN_YEARS = 6
+COLUMNS = ["n", "annee0", "annee1", "v0", "v1", "delta", "pct", "pente", "tcac",
+           "volatilite", "anomalie", "annee_anomalie"]
+
+
+def _group_median(gid: np.ndarray, values: np.ndarray, starts: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Médiane par groupe (groupes contigus, sans NaN) par un seul tri."""
+    if len(n) and (n == n[0]).all():
+        # Cube complet (cas courant PxWeb) : séries de même longueur -> tableau 2D
+        return np.median(values.reshape(len(n), n[0]), axis=1)
+    s = values[np.lexsort((values, gid))]
+    return (s[starts + (n - 1) // 2] + s[starts + n // 2]) / 2
+
+
+def series_stats(view: pd.Series) -> pd.DataFrame:
+    """
+    Statistiques par série du cube (indicateur, action, annee) -> valeur.
+
+    Colonnes : n, annee0, annee1, v0, v1, delta, pct, pente (unités/an),
+    tcac (%/an), volatilite (écart-type des log-variations), anomalie
+    (bool) et annee_anomalie. Index (indicateur, action) ; séries d'au
+    moins 2 années.
+    """
+    if not view.index.is_monotonic_increasing:
+        view = view.sort_index()
+    if view.empty:
+        return pd.DataFrame(columns=COLUMNS, index=pd.MultiIndex.from_arrays([[], []], names=SERIES_LEVELS))
+
+    # Séries contiguës dans le cube trié : un nouveau groupe à chaque changement de (indicateur, action)
+    ind, act = (np.asarray(view.index.codes[view.index.names.index(lv)]) for lv in SERIES_LEVELS)
+    new = np.r_[True, (ind[1:] != ind[:-1]) | (act[1:] != act[:-1])]
+    starts = np.flatnonzero(new)
+    gid = np.cumsum(new) - 1
+    n_groups = len(starts)
+    n = np.diff(np.r_[starts, len(gid)])
+    ends = starts + n - 1
+
+    year = view.index.get_level_values("annee").to_numpy(dtype=np.float64)
+    y = view.to_numpy(dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # ---- OLS : x centré sur l'année moyenne de la série (stabilité numérique)
+        x = year - (np.bincount(gid, year, n_groups) / n)[gid]
+        sxx, sxy = np.bincount(gid, x * x, n_groups), np.bincount(gid, x * y, n_groups)
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+        mean_y = np.bincount(gid, y, n_groups) / n
+
+        # ---- Premier / dernier point, TCAC
+        v0, v1 = y[starts], y[ends]
+        y0, y1 = year[starts], year[ends]
+        span = y1 - y0
+        cagr = np.where((v0 > 0) & (v1 > 0) & (span > 0), (v1 / v0) ** (1 / span) - 1, np.nan) * 100
+        pct = np.where(v0 != 0, (v1 - v0) / v0 * 100, np.nan)
+
+        # ---- Volatilité : écart-type des log-variations annuelles (sans le premier point de chaque série)
+        ret = np.diff(np.log(np.where(y > 0, y, np.nan)), prepend=np.nan)
+        ret[starts] = np.nan
+        ok = ~np.isnan(ret)
+        k = np.bincount(gid[ok], minlength=n_groups)
+        m = np.bincount(gid[ok], ret[ok], n_groups) / k
+        ss = np.bincount(gid[ok], (ret[ok] - m[gid[ok]]) ** 2, n_groups)
+        vol = np.where(k > 1, np.sqrt(ss / (k - 1)), np.nan)
+
+        # ---- Anomalie : résidu extrême autour de la droite de tendance
+        resid = y - mean_y[gid] - np.nan_to_num(slope)[gid] * x
+        dev = np.abs(resid - _group_median(gid, resid, starts, n)[gid])
+        mad = _group_median(gid, dev, starts, n)[gid]
+        scale = np.maximum(np.abs(mean_y), 1e-12)[gid]
+        # MAD nulle (série presque linéaire) : tout écart notable est anormal
+        z = np.where(mad > 1e-9 * scale, 0.6745 * dev / mad, np.where(dev > 1e-6 * scale, np.inf, 0.0))
+    z_max = np.maximum.reduceat(z, starts)
+    # Année du maximum : dernière position de chaque groupe où z atteint son max
+    arg = np.maximum.reduceat(np.where(z == z_max[gid], np.arange(len(z)), -1), starts)
+    anomaly = (z_max > ANOMALY_Z + ANOMALY_Z_SMALL / n) & (n >= ANOMALY_MIN_YEARS)
+
+    keys = view.index.droplevel("annee")[starts]
+    out = pd.DataFrame({
+        "n": n, "annee0": y0.astype(np.int64), "annee1": y1.astype(np.int64),
+        "v0": v0, "v1": v1, "delta": v1 - v0, "pct": pct, "pente": slope, "tcac": cagr,
+        "volatilite": vol, "anomalie": anomaly,
+        "annee_anomalie": pd.array(np.where(anomaly, year[arg], np.nan), dtype="Int64"),
+    }, index=keys)
+    return out[out["n"] >= 2]
+
+
+# Critères de classement : libellé -> (colonne, tri par valeur absolue)
+RANKINGS = {
+    "Variation (%)": ("pct", True),
+    "Pente (unités/an)": ("pente", True),
+    "TCAC (%/an)": ("tcac", True),
+    "Volatilité": ("volatilite", False),
+    "Anomalies d'abord": ("anomalie", False),
+}
+
+
+def rank_series(stats: pd.DataFrame, criterion: str) -> pd.DataFrame:
+    """Séries triées par critère décroissant (valeur absolue si demandé), NaN en dernier ; ex aequo par |delta|."""
+    col, absolute = RANKINGS[criterion]
+    key = stats[col].astype(np.float64)
+    if absolute:
+        key = key.abs()
+    order = np.lexsort((-stats["delta"].abs().to_numpy(), -key.fillna(-np.inf).to_numpy()))
+    return stats.iloc[order]
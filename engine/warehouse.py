@@ -0,0 +1,222 @@
+"""
+Entrepôt analytique local (optionnel) pour toutes les sources de l'app.
+
+Les jeux PxWeb, fichiers et fictifs sont versés dans une seule table longue
+`mesures` (source, action, indicateur, annee, valeur + jeu d'origine),
+indexée sur (source, action, indicateur, annee). Les filtres de l'UI et
+l'agrégation du cube sont exécutés en SQL dans le moteur : seul le
+résultat agrégé ou filtré remonte dans le processus.
+
+DuckDB (colonnaire) est utilisé s'il est installé, sinon SQLite (stdlib).
+
+Partage entre processus (app, répliques, `python -m engine ... --warehouse`) :
+aucune connexion n'est gardée ouverte durablement. Les lectures passent par
+une connexion en lecture seule, refermée après READ_LINGER secondes
+d'inactivité (les requêtes d'un même rerun la réutilisent), chaque versement
+par une connexion courte en écriture. DuckDB verrouille le fichier entier :
+un versement attend (jusqu'à LOCK_TIMEOUT secondes) que les autres processus
+aient refermé leurs connexions, et inversement. Contrainte restante : une app
+sollicitée sans pause de READ_LINGER secondes, ou un versement très long,
+tient le verrou d'autant ; au-delà de LOCK_TIMEOUT, l'autre processus échoue
+(IOException). SQLite est ouvert en mode WAL : lecteurs et écrivain ne se
+bloquent pas, seuls les écrivains s'attendent.
+"""
+import contextlib
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .aggregates import CUBE_LEVELS
+
+LABELS = ("source", "action", "indicateur")
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS mesures (
+        dataset VARCHAR, source VARCHAR, action VARCHAR, indicateur VARCHAR,
+        annee INTEGER, valeur DOUBLE)""",
+    "CREATE INDEX IF NOT EXISTS mesures_filtres ON mesures (source, action, indicateur, annee)",
+    "CREATE INDEX IF NOT EXISTS mesures_dataset ON mesures (dataset)",
+    "CREATE TABLE IF NOT EXISTS meta (cle VARCHAR PRIMARY KEY, version INTEGER)",
+]
+
+# Attente maximale (s) du verrou de fichier tenu par un autre processus
+LOCK_TIMEOUT = 30.0
+# Inactivité (s) après laquelle la connexion de lecture est refermée
+READ_LINGER = 0.2
+
+
+class Warehouse:
+    """Connexions courtes (lecture seule ou écriture), sérialisées dans le processus par un verrou."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            import duckdb
+        except ImportError:
+            self.engine = "sqlite"
+            self._busy = (sqlite3.OperationalError,)
+        else:
+            self.engine = "duckdb"
+            self._duckdb = duckdb
+            self._busy = (duckdb.IOException,)
+        self._lock = threading.Lock()
+        self._reader = None
+        self._release_timer = None
+        with self._connect(write=True) as con:
+            if self.engine == "sqlite":
+                con.execute("PRAGMA journal_mode=WAL")
+            for stmt in _SCHEMA:
+                con.execute(stmt)
+            con.execute("INSERT INTO meta SELECT 'version', 0 WHERE NOT EXISTS (SELECT 1 FROM meta)")
+
+    def _open(self, write: bool):
+        if self.engine == "sqlite":
+            if write:
+                return sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            # La connexion de lecture peut être refermée par le minuteur (autre thread)
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=LOCK_TIMEOUT,
+                                   check_same_thread=False)
+        return self._duckdb.connect(self.path, read_only=not write)
+
+    def _open_retry(self, write: bool):
+        """Ouvre une connexion ; réessaie tant qu'un autre processus tient le verrou du fichier."""
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        delay = 0.01
+        while True:
+            try:
+                return self._open(write)
+            except self._busy as e:
+                if "lock" not in str(e).lower() or time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def _close_reader(self):
+        if self._release_timer is not None:
+            self._release_timer.cancel()
+            self._release_timer = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _release(self, timer):
+        with self._lock:
+            if self._release_timer is timer:
+                self._close_reader()
+
+    @contextlib.contextmanager
+    def _connect(self, write: bool = False):
+        with self._lock:
+            if write:
+                # DuckDB refuse deux connexions au même fichier avec des modes différents
+                self._close_reader()
+                con = self._open_retry(True)
+                try:
+                    yield con
+                    if self.engine == "sqlite":
+                        con.commit()
+                finally:
+                    con.close()
+                return
+            if self._release_timer is not None:
+                self._release_timer.cancel()
+            if self._reader is None:
+                self._reader = self._open_retry(False)
+            try:
+                yield self._reader
+            finally:
+                timer = threading.Timer(READ_LINGER, lambda: self._release(timer))
+                timer.daemon = True
+                self._release_timer = timer
+                timer.start()
+
+    def _query(self, sql: str, params: Sequence = ()) -> pd.DataFrame:
+        with self._connect() as con:
+            if self.engine == "duckdb":
+                return con.execute(sql, list(params)).df()
+            return pd.read_sql_query(sql, con, params=list(params))
+
+    # ---- écriture ----
+    def ingest(self, dataset: str, df: pd.DataFrame):
+        """Remplace les lignes du jeu `dataset` par celles de `df` (schéma long)."""
+        annee = pd.to_numeric(df["annee"], errors="coerce")
+        valeur = pd.to_numeric(df["valeur"], errors="coerce")
+        keep = (annee.notna() & valeur.notna()).to_numpy()
+        rows = pd.DataFrame({c: df[c].astype(str).to_numpy()[keep] for c in LABELS})
+        rows.insert(0, "dataset", dataset)
+        rows["annee"] = annee.to_numpy()[keep].astype("int64")
+        rows["valeur"] = valeur.to_numpy()[keep].astype("float64")
+        with self._connect(write=True) as con:
+            con.execute("DELETE FROM mesures WHERE dataset = ?", [dataset])
+            if self.engine == "duckdb":
+                con.register("_ingest", rows)
+                con.execute("INSERT INTO mesures SELECT * FROM _ingest")
+                con.unregister("_ingest")
+            else:
+                con.executemany(
+                    "INSERT INTO mesures VALUES (?, ?, ?, ?, ?, ?)",
+                    rows.astype(object).itertuples(index=False, name=None),
+                )
+            con.execute("UPDATE meta SET version = version + 1 WHERE cle = 'version'")
+
+    # ---- lecture ----
+    def version(self) -> int:
+        return int(self._query("SELECT version FROM meta WHERE cle = 'version'").iloc[0, 0])
+
+    def distinct(self, column: str, sources: Optional[Iterable] = None) -> List[str]:
+        """Valeurs distinctes de `column`, restreintes aux sources données (toutes si vide)."""
+        assert column in LABELS
+        sources = list(sources or [])
+        where = f" WHERE source IN ({', '.join('?' * len(sources))})" if sources else ""
+        return self._query(f"SELECT DISTINCT {column} FROM mesures{where} ORDER BY 1", sources)[column].tolist()
+
+    def year_range(self) -> Optional[Tuple[int, int]]:
+        r = self._query("SELECT MIN(annee) AS lo, MAX(annee) AS hi FROM mesures")
+        if r.empty or pd.isna(r.iloc[0, 0]):
+            return None
+        return int(r.iloc[0, 0]), int(r.iloc[0, 1])
+
+    @staticmethod
+    def _where(actions: Iterable, years: Tuple[int, int], indicators: Optional[Iterable],
+               sources: Optional[Iterable] = None) -> Tuple[str, list]:
+        """Clause WHERE paramétrée ; `indicators` / `sources` vides = pas de filtre."""
+        actions = list(actions)
+        clauses, params = [], []
+        if sources:
+            sources = list(sources)
+            clauses.append(f"source IN ({', '.join('?' * len(sources))})")
+            params += [str(s) for s in sources]
+        clauses.append(f"action IN ({', '.join('?' * len(actions))})" if actions else "FALSE")
+        params += [str(a) for a in actions]
+        if indicators:
+            indicators = list(indicators)
+            clauses.append(f"indicateur IN ({', '.join('?' * len(indicators))})")
+            params += [str(i) for i in indicators]
+        clauses.append("annee BETWEEN ? AND ?")
+        params += [int(years[0]), int(years[1])]
+        return " AND ".join(clauses), params
+
+    def cube(self, actions: Iterable, years: Tuple[int, int], indicators: Optional[Iterable] = None,
+             sources: Optional[Iterable] = None) -> pd.Series:
+        """Cube (indicateur, action, annee) -> somme de valeur, agrégé dans le moteur."""
+        where, params = self._where(actions, years, indicators, sources)
+        df = self._query(
+            f"SELECT indicateur, action, annee, SUM(valeur) AS valeur FROM mesures "
+            f"WHERE {where} GROUP BY indicateur, action, annee ORDER BY indicateur, action, annee",
+            params,
+        )
+        return df.set_index(CUBE_LEVELS)["valeur"].astype("float64")
+
+    def rows(self, actions: Iterable, years: Tuple[int, int], indicators: Optional[Iterable] = None,
+             sources: Optional[Iterable] = None, last_year_only: bool = False) -> pd.DataFrame:
+        """Lignes de la vue (ou de sa dernière année seulement)."""
+        where, params = self._where(actions, years, indicators, sources)
+        if last_year_only:
+            where = f"{where} AND annee = (SELECT MAX(annee) FROM mesures WHERE {where})"
+            params = params + params
+        return self._query(
+            f"SELECT source, action, indicateur, annee, valeur FROM mesures WHERE {where}", params
+        )